@@ -1,38 +1,167 @@
 
 import os
-import re
+import json
+import time
+import uuid
+import hashlib
+import asyncio
 from datetime import datetime
+from collections import OrderedDict
 
 # --- Third-party ---
 import pandas as pd
 from dotenv import load_dotenv
-from agents import Agent, Runner
-from .agents_client import model_client_name_dict
+from agents import Agent, function_tool
+from .tracing import Tracer
+from .llm_cache import LLMResponseCache
+from .model_router import ModelRouter
 from mcp_server.mcp_server import Agentic_MCP_Server
+from utils.utils import format_profile
+from utils.dataset_cache import CACHE_VERSION, IncrementalLoader, make_cube_text
+from .code_execution import CodeSandbox, CodeExecutionError, extract_python_code
+from .code_validator import ChartCodeValidationError, validate_chart_code
+from .render_cache import RenderCache, OUT_PATH_PLACEHOLDER
+from .chart_images import ChartImageEncoder
+from .pipeline import StagePipeline
 from .out_puts import PythonCodeResult, ReflectImprovedPythonCodeResult, PythonCodeCheckedResult
 from .instructions import build_chart_code, email_instructions, reflect_on_chart_and_improve, code_bug_fixer
 
 load_dotenv(override=True)
 
+def make_out_path_name(name: str) -> str:
+    """Return a unique chart path in out_puts/ (or CHART_OUTPUT_DIR); the short uuid keeps concurrent runs from colliding."""
+    dt = datetime.now()
+    return os.path.join(os.getenv("CHART_OUTPUT_DIR", os.path.join(os.getcwd(), "out_puts")), f"{name}_{dt.strftime("%Y_%m_%d")}{dt.hour}{dt.minute}{dt.second}_{uuid.uuid4().hex[:6]}.png")
+
+def repair_signature(python_code: str, error_message: str, out_path_name: str) -> str:
+    """Key for memoised repairs: the failing code together with the error it raised.
+    
+    The run-specific output path is replaced by a placeholder so fixes carry over between runs.
+    """
+    signature = f"{python_code}\0{error_message}".replace(out_path_name, OUT_PATH_PLACEHOLDER)
+    return hashlib.sha256(signature.encode("utf-8")).hexdigest()
+
+def hide_out_path(text: str | None, out_path_name: str) -> str | None:
+    """Replace the run-specific output path with the placeholder, so prompts hash the same across runs."""
+    return text.replace(out_path_name, OUT_PATH_PLACEHOLDER) if text else text
+
+def load_queries(path: str) -> list[str]:
+    """Read chart queries from a JSONL file ({"query": "..."} per line) or a plain text file."""
+    queries = []
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                queries.append(json.loads(line)["query"])
+            else:
+                queries.append(line)
+    return queries
+
 class DataProcessingAgentic:
     
-    def __init__(self, name: str, model_name: str="llama3.2", dataset_path:str="coffee_sales.csv"):
+    def __init__(self, name: str, model_name: str="llama3.2", dataset_path:str="coffee_sales.csv", 
+                 llm_cache: LLMResponseCache=None, 
+                 render_cache: RenderCache=None,
+                 sandbox_workers: int=0, 
+                 lazy_mcp_servers: bool=True,
+                 repair_candidates: int=1,
+                 repair_models: list[str]=None,
+                 max_repair_rounds: int=50,
+                 repair_memo_size: int=256,
+                 sales_cube: bool=True,
+                 ingest_mode: str="frame",
+                 ingest_chunksize: int=None,
+                 tracer: Tracer=None,
+                 send_email: bool=True,
+                 router: ModelRouter=None,
+                 model_pools: dict[str, list[str]]=None,
+                 hedge_requests: bool=True,
+                 chart_images: ChartImageEncoder=None,
+                 reflect_with_image: bool=True,
+                 incremental_refresh: bool=True,
+                 sql_tool: bool=True):
         self.name = name
-        self.df = None
+        self.lazy_mcp_servers = lazy_mcp_servers
+        # Speculative repair: each round asks repair_candidates fixes at once, spread over repair_models
+        self.repair_candidates = repair_candidates
+        self.repair_models = repair_models or ["qwen3-coder"]
+        self.max_repair_rounds = max_repair_rounds
+        # Fixes that worked, keyed on repair_signature; the least recently used are dropped past repair_memo_size
+        self.repair_memo: OrderedDict[str, str] = OrderedDict()
+        self.repair_memo_size = repair_memo_size
+        self.llm_cache = llm_cache if llm_cache is not None else LLMResponseCache()
+        self.render_cache = render_cache if render_cache is not None else RenderCache()
+        self.tracer = tracer if tracer is not None else Tracer()
+        self.sandbox_workers = sandbox_workers
+        self.sandbox = None
+        self.csv_path = None
+        # Pre-aggregated year/quarter/month/coffee_name/cash_type cube exposed to generated code as 'cube'
+        self.sales_cube = sales_cube
+        self.cube_text = None
+        # Profile of the live frame (columns, ranges, distinct values) used by every prompt
+        self.schema_text = None
+        # "frame" keeps the row-level df in memory; "cube" only streams the aggregates, for CSVs larger
+        # than memory. ingest_chunksize streams the CSV in chunks of that many rows instead of parsing
+        # it in one go; in frame mode that bounds the cache build, not the loaded frame.
+        self.ingest_mode = ingest_mode
+        self.ingest_chunksize = ingest_chunksize
+        # Append-only sources: each query first ingests only the rows added since the last load
+        self.incremental_refresh = incremental_refresh
+        self.loader = None
         self.dataset_path=dataset_path
+        self.send_email = send_email
+        # Models each capability may be routed to, in order of preference until latencies are known
+        self.router = router if router is not None else ModelRouter(hedging=hedge_requests)
+        self.model_pools = {"code": ["qwen3-coder", "qwen3"], "email": ["ollama"], "vision": ["gemma12B_v", "gemma4B_v"]}
+        self.model_pools.update(model_pools or {})
         self.model_name = model_name
+        # Reflection attaches a downscaled copy of the first chart and runs on the vision pool
+        self.reflect_with_image = reflect_with_image
+        self.chart_images = chart_images if chart_images is not None else ChartImageEncoder()
         self.agentic_mcp_server = None
+        # The code model may look values and totals up with SQL before writing the chart code
+        self.chart_tools = [self.sql_query_tool()] if sql_tool else []
         
     async def connect_to_servers(self):
-        self.agentic_mcp_server = Agentic_MCP_Server()
+        self.agentic_mcp_server = Agentic_MCP_Server(lazy=self.lazy_mcp_servers)
         await self.agentic_mcp_server.connect_to_servers()
         return self.agentic_mcp_server
     
-    async def check_python_code_agent(self, buggy_code:str, model_name:str, out_path_name:str, error_message:str):
+    def sql_query_tool(self):
+        """filesystem_server's sql_query as a tool of its own, so the code model gets none of the file-writing tools."""
+        
+        @function_tool
+        async def sql_query(sql: str, max_rows: int = 200) -> str:
+            """Run a read-only SQL query (SQLite dialect) over the 'sales' table, which holds the same rows as df.
+            
+            Args:
+                sql: One SELECT (or WITH ... SELECT) statement, e.g. SELECT year, month, SUM(price) FROM sales GROUP BY year, month
+                max_rows: Maximum number of rows to return
+            """
+            with self.tracer.span("tool.sql_query"):
+                if self.agentic_mcp_server is None:
+                    self.agentic_mcp_server = await self.connect_to_servers()
+                await self.agentic_mcp_server.ensure_server("filesystem_server")
+                result = await self.agentic_mcp_server.call_tool("sql_query", {"sql": sql, "max_rows": max_rows})
+                return "\n".join(content.text for content in result.content if getattr(content, "text", None))
+        
+        return sql_query
+    
+    async def check_python_code_agent(self, buggy_code:str, model_name:str, out_path_name:str, error_message:str, traceback:str=None, attempt:str=None):
         
         messages = [{"role": "user", "content": " You are a Python debugging expert. Fix the code error."}]
+        # Distinct attempts must not collapse onto the same cached response
+        if attempt is not None:
+            messages[0]["content"] += f" (attempt {attempt})"
         
-        instruction = code_bug_fixer(out_path_name = out_path_name, buggy_code = buggy_code, error_message = error_message)
+        # The prompt only names the placeholder path, so identical repairs hit the response cache
+        instruction = code_bug_fixer(out_path_name = OUT_PATH_PLACEHOLDER, 
+                                     buggy_code = hide_out_path(buggy_code, out_path_name), 
+                                     error_message = hide_out_path(error_message, out_path_name), 
+                                     traceback = hide_out_path(traceback, out_path_name), 
+                                     cube_text = self.cube_text, schema_text = self.schema_text)
         
         agent =  Agent(
                     name = self.name,
@@ -40,8 +169,10 @@ class DataProcessingAgentic:
                     model = self.get_model(self.model_name) if model_name is None else self.get_model(model_name),
                     output_type=PythonCodeCheckedResult,)
         
-        check_python_code_result = await Runner.run(agent, messages)
-        return check_python_code_result.final_output.python_code.strip()
+        # The candidate's model goes first; the rest of the code pool only serves as hedge or fallback
+        models = [model_name] + [name for name in self.model_pools["code"] if name != model_name] if model_name else None
+        check_python_code_result = await self.run_agent("llm.repair", agent, messages, capability="code", models=models, ordered=model_name is not None)
+        return check_python_code_result.final_output.python_code.strip().replace(OUT_PATH_PLACEHOLDER, out_path_name)
         
     async def generate_chart_python_agent(self, generate_chart_instructions:str, 
                                           tools_details: list=[], 
@@ -52,12 +183,15 @@ class DataProcessingAgentic:
         if self.agentic_mcp_server is None:
             self.agentic_mcp_server = await self.connect_to_servers()
         
-        instructions_ = build_chart_code(instruction=generate_chart_instructions, out_path_name=out_path_name)
+        # Callers put out_path_name back into the returned code; see hide_out_path
+        instructions_ = build_chart_code(instruction=generate_chart_instructions, out_path_name=OUT_PATH_PLACEHOLDER, cube_text=self.cube_text, schema_text=self.schema_text,
+                                         sql_tool=bool(self.chart_tools))
 
         return Agent(
             name = self.name,
             instructions = instructions_,
             model = self.get_model(self.model_name) if model_name is None else self.get_model(model_name),
+            tools = self.chart_tools,
             output_type=output_type,
             )
     
@@ -70,7 +204,8 @@ class DataProcessingAgentic:
         if self.agentic_mcp_server is None:
             self.agentic_mcp_server = await self.connect_to_servers()
         
-        instruction = reflect_on_chart_and_improve(out_path_name=out_path_name, python_code_v1=python_code_v1)
+        # Callers put out_path_name back into the returned code; see hide_out_path
+        instruction = reflect_on_chart_and_improve(out_path_name=OUT_PATH_PLACEHOLDER, python_code_v1=python_code_v1, cube_text=self.cube_text, schema_text=self.schema_text)
             
         return Agent(
             name = self.name,
@@ -90,136 +225,461 @@ class DataProcessingAgentic:
             name = self.name,
             instructions = instruction,
             model = self.get_model(model_name),
-            mcp_servers = self.agentic_mcp_server.mcp_servers["email_server"], 
+            mcp_servers = await self.agentic_mcp_server.get_mcp_servers("email_server"), 
             output_type=output_type,)
     
-    async def run(self, query:str="Create a plot comparing Q1 coffee sales in 2024 and 2025 using the data in coffee_sales.csv."):
+    async def run_agent(self, step: str, agent: Agent, messages, capability: str=None, models: list[str]=None,
+                        ordered: bool=False, hedge: bool=True, fallback: bool=True):
+        """Runner.run through the response cache, traced with the model name and token usage.
         
-        try:
-            self.load_and_prepare_data()
-            print(self.df.head())
-            
-            dt = datetime.now()
-            name = f"generate_chart_{dt.strftime("%Y_%m_%d")}{dt.hour}{dt.minute}{dt.second}"
-            out_path_name=os.path.join(os.getcwd(),"out_puts",f"{name}.png")
+        With a capability the model router picks the backend from models (default: that capability's pool).
+        """
+        with self.tracer.span(step) as span:
+            if capability is None:
+                result = await self.llm_cache.run(agent, messages)
+            else:
+                result, agent, route = await self.router.run(agent, messages, self.llm_cache.run, capability,
+                                                             models=models or self.model_pools.get(capability),
+                                                             ordered=ordered, hedge=hedge, fallback=fallback)
+                span.set(**route)
+            self.tracer.record_run_result(span, agent, result)
+            return result
+    
+    async def setup(self):
+        """Load the dataset and connect the MCP servers once, so several queries can share them."""
+        with self.tracer.span("setup"):
+            if self.loader is None:
+                with self.tracer.span("load_data", ingest_mode=self.ingest_mode) as span:
+                    self.load_and_prepare_data()
+                    span.set(rows=self.loader.rows)
             
             if self.agentic_mcp_server is None:
-                self.agentic_mcp_server = await self.connect_to_servers()
-                     
-            ## STEP: 1
-            generate_chart_python_agent = await self.generate_chart_python_agent(generate_chart_instructions = query, 
-                                                                    out_path_name = out_path_name,
-                                                                    model_name = self.get_model("qwen3-coder"), # ollama3  gemma12B_v qwen3 gemini deepseek qwen3-coder
-                                                                    output_type = PythonCodeResult,
-                                                                    )
-            
-            content_ = """ You are a data visualization expert.
-                            Return your answer *strictly* in this format:
-                            {"python_code": "<execute_python> # valid python code here </execute_python>"}
-                        """
-            
-            messages = [{"role": "user", "content": content_}]
-            generate_chart_python_result = await Runner.run(generate_chart_python_agent, messages)
-            
-            # ## STEP: 2
-            content_ = """ You are a data visualization expert.
-                            Your task: critique the attached chart and the original code against the given instruction,
-                            then return improved matplotlib code
-                        """
-            python_code_v1 = generate_chart_python_result.final_output.python_code.strip()
-            
-            await self.check_excusion_python_code(python_code_v1)
+                with self.tracer.span("mcp.connect", lazy=self.lazy_mcp_servers) as span:
+                    self.agentic_mcp_server = await self.connect_to_servers()
+                    span.set(server_startup_s=dict(self.agentic_mcp_server.startup_timings))
             
-            dt = datetime.now()
-            name = f"reflect_chart_{dt.strftime("%Y_%m_%d")}{dt.hour}{dt.minute}{dt.second}"
-            out_path_name = os.path.join(os.getcwd(),"out_puts",f"{name}.png")
-            
-            reflect_python_code_agent = await self.reflect_improve_chart_python_agent( 
-                                                                    out_path_name=out_path_name, 
-                                                                    python_code_v1=python_code_v1,
-                                                                    model_name=self.get_model("qwen3-coder"),
-                                                                    output_type=ReflectImprovedPythonCodeResult,
-                                                                    )
+            if self.sandbox is None and self.sandbox_workers > 0:
+                with self.tracer.span("sandbox.start", workers=self.sandbox_workers):
+                    self.sandbox = await CodeSandbox(self.csv_path, workers=self.sandbox_workers, sales_cube=self.sales_cube,
+                                                     ingest_mode=self.ingest_mode, chunksize=self.ingest_chunksize).start()
+        return self
+    
+    async def cleanup(self):
+        """Close the MCP server connections and sandbox workers opened by setup()."""
+        with self.tracer.span("cleanup"):
+            if self.sandbox is not None:
+                await self.sandbox.close()
+                self.sandbox = None
             
+            if self.agentic_mcp_server is not None:
+                await self.agentic_mcp_server.cleanup()
+                self.agentic_mcp_server = None
+    
+    async def run(self, query:str="Create a plot comparing Q1 coffee sales in 2024 and 2025 using the data in coffee_sales.csv."):
+        
+        with self.tracer.span("run"):
+            try:
+                await self.setup()
+                print(self.df.head())
+                return await self.run_query(query)
+                
+            except Exception as e:
+                print(f"Error running {self.name}: {e}")
+            finally:
+                await self.cleanup()
+    
+    async def run_batch(self, queries: list[str] | str, max_concurrency: int=4) -> list[dict]:
+        """Run many chart queries concurrently, sharing the MCP servers, model clients and DataFrame.
+        
+        Args:
+            queries: List of queries or path to a JSONL/text file with one query per line
+            max_concurrency: Maximum number of queries in flight at the same time
+        """
+        if isinstance(queries, str):
+            queries = load_queries(queries)
+        
+        semaphore = asyncio.Semaphore(max_concurrency)
+        
+        async def run_one(query: str) -> dict:
+            async with semaphore:
+                try:
+                    return await self.run_query(query)
+                except Exception as e:
+                    print(f"Error running {self.name} on query {query!r}: {e}")
+                    return {"query": query, "status": "failure", "message": str(e)}
+        
+        with self.tracer.span("run_batch", queries=len(queries), max_concurrency=max_concurrency):
+            try:
+                await self.setup()
+                return await asyncio.gather(*(run_one(query) for query in queries))
+            finally:
+                await self.cleanup()
+
+    async def run_pipeline(self, queries: list[str] | str, stage_concurrency: dict[str, int]=None, queue_size: int=8,
+                           email_batch_size: int=8, email_batch_seconds: float=2.0) -> list[dict]:
+        """Run many chart queries through per-stage worker pools, overlapping the stages of different queries.
+
+        Args:
+            queries: List of queries or path to a JSONL/text file with one query per line
+            stage_concurrency: Workers per stage (generate, exec, reflect, reexec, email)
+            queue_size: Capacity of the queue in front of each stage
+            email_batch_size: Most queries reported in one email
+            email_batch_seconds: Longest wait for more queries before sending an email
+        """
+        if isinstance(queries, str):
+            queries = load_queries(queries)
+
+        pipeline = StagePipeline(self, concurrency=stage_concurrency, queue_size=queue_size,
+                                 email_batch_size=email_batch_size, email_batch_seconds=email_batch_seconds)
+        with self.tracer.span("run_pipeline", queries=len(queries), **{f"{stage}_workers": workers for stage, workers in pipeline.concurrency.items()}):
+            try:
+                await self.setup()
+                return await pipeline.run(queries)
+            finally:
+                await self.cleanup()
+    
+    async def run_query(self, query: str) -> dict:
+        """Run the generate, reflect and email steps for one query. Requires setup() to have been called."""
+        with self.tracer.span("run_query", query=query) as span:
+            result = await self._run_query(query)
+            result["trace_id"] = span.trace_id
+            return result
+    
+    async def _run_query(self, query: str) -> dict:
+        job = {"query": query}
+        await self.generate_stage(job)
+        await self.exec_stage(job)
+        await self.reflect_stage(job)
+        await self.reexec_stage(job)
+        if self.send_email:
+            await self.email_stage([job])
+        return self.job_result(job)
+    
+    # The stages below each take a job dict and add their outputs to it; run_query chains them for
+    # one query, StagePipeline runs them as separate worker pools so stages of different queries overlap.
+    
+    async def generate_stage(self, job: dict) -> dict:
+        """STEP 1: ask the code model for the first version of the chart code."""
+        if self.incremental_refresh and self.loader is not None:
+            self.refresh_data()
+        job["out_path_v1"] = make_out_path_name("generate_chart")
+        generate_chart_python_agent = await self.generate_chart_python_agent(generate_chart_instructions = job["query"], 
+                                                                out_path_name = job["out_path_v1"],
+                                                                output_type = PythonCodeResult,
+                                                                )
+        
+        content_ = """ You are a data visualization expert.
+                        Return your answer *strictly* in this format:
+                        {"python_code": "<execute_python> # valid python code here </execute_python>"}
+                    """
+        
+        messages = [{"role": "user", "content": content_}]
+        generate_chart_python_result = await self.run_agent("llm.generate", generate_chart_python_agent, messages, capability="code")
+        job["python_code_v1"] = generate_chart_python_result.final_output.python_code.strip().replace(OUT_PATH_PLACEHOLDER, job["out_path_v1"])
+        return job
+    
+    async def exec_stage(self, job: dict) -> dict:
+        """Render the first chart (repairing the code if needed) and encode it for the vision models.
+        
+        chart_v1 is the rendered file, which for a render cache hit is the stored object itself.
+        """
+        _, job["chart_v1"] = await self.check_excusion_python_code(job["python_code_v1"], out_path_name=job["out_path_v1"])
+        job["chart_image"] = await self.encode_chart(job["chart_v1"]) if self.reflect_with_image else None
+        return job
+    
+    async def reflect_stage(self, job: dict) -> dict:
+        """STEP 2: critique the first chart and its code, and get the improved code."""
+        content_ = """ You are a data visualization expert.
+                        Your task: critique the attached chart and the original code against the given instruction,
+                        then return improved matplotlib code
+                    """
+        job["out_path_v2"] = make_out_path_name("reflect_chart")
+        
+        reflect_python_code_agent = await self.reflect_improve_chart_python_agent( 
+                                                                out_path_name=job["out_path_v2"], 
+                                                                python_code_v1=hide_out_path(job["python_code_v1"], job["out_path_v1"]),
+                                                                output_type=ReflectImprovedPythonCodeResult,
+                                                                )
+        
+        chart_image = job.get("chart_image")
+        if chart_image is None:
             messages = [{"role": "user", "content": content_}]
-            reflect_python_code_agent_result = await Runner.run(reflect_python_code_agent, messages)
-            
-            ## STEP: 3
-            content_ = """ You are expert in send emails to one or more recipients with custom subject and message content.
-                           with a subject line and body content """
-            
-            report = f"feedback: {reflect_python_code_agent_result.final_output.feedback.strip()}  \n Python code: {reflect_python_code_agent_result.final_output.python_code.strip()}"
+        else:
+            messages = [{"role": "user", "content": [{"type": "input_text", "text": content_},
+                                                     {"type": "input_image", "image_url": chart_image, "detail": "low"}]}]
+        reflect_python_code_agent_result = await self.run_agent("llm.reflect", reflect_python_code_agent, messages,
+                                                                capability="code" if chart_image is None else "vision")
+        
+        job["feedback"] = reflect_python_code_agent_result.final_output.feedback.strip()
+        job["python_code_v2"] = reflect_python_code_agent_result.final_output.python_code.strip().replace(OUT_PATH_PLACEHOLDER, job["out_path_v2"])
+        return job
+    
+    async def reexec_stage(self, job: dict) -> dict:
+        """Render the improved chart, repairing the code if needed."""
+        _, job["chart_v2"] = await self.check_excusion_python_code(job["python_code_v2"], name="reflect_chart", out_path_name=job["out_path_v2"])
+        return job
+    
+    async def email_stage(self, jobs: list[dict]) -> list[dict]:
+        """STEP 3: send one email reporting on all the given jobs."""
+        content_ = """ You are expert in send emails to one or more recipients with custom subject and message content.
+                       with a subject line and body content """
+        
+        if len(jobs) == 1:
+            report = f"feedback: {jobs[0]['feedback']}  \n Python code: {jobs[0]['python_code_v2']}"
+        else:
+            # Coalesced: one email (and one model call) for several queries
+            report = "\n\n".join(f"Chart {number}: {job['query']}  \n feedback: {job['feedback']}  \n Python code: {job['python_code_v2']}"
+                                 for number, job in enumerate(jobs, start=1))
+        
+        email_sender_agent = await self.send_email_agent(report = report, 
+                                                         model_name = "ollama",) ## ollama qwen3-coder qwen3
+        
+        messages = [{"role": "user", "content": content_}]
+        # Sending is a side effect: never hedge or retry it on another backend
+        await self.run_agent("llm.email", email_sender_agent, messages, capability="email", hedge=False, fallback=False)
+        return jobs
+    
+    @staticmethod
+    def job_result(job: dict) -> dict:
+        chart = job.get("chart_v2")
+        return {"query": job["query"], "status": "success", "feedback": job["feedback"], "python_code": job["python_code_v2"],
+                "chart": chart if chart is not None and os.path.exists(chart) else None}
+    
+    async def encode_chart(self, chart_path: str | None) -> str | None:
+        """Data URL of the downscaled chart for the vision models, or None when it was not rendered.
+        
+        Hashing and resizing run in a thread, so other queries keep going on the event loop meanwhile.
+        """
+        if chart_path is None or not os.path.exists(chart_path):
+            return None
+        with self.tracer.span("image.encode") as span:
+            encoded = await asyncio.to_thread(self.chart_images.encode, chart_path)
+            span.set(cache_hit=encoded["cache_hit"], encoded_bytes=encoded["encoded_bytes"], source_bytes=os.path.getsize(chart_path))
+            return encoded["data_url"]
+    
+    def get_model(self, model_name: str):
+        """Return the model client for a registry name or model id, warning when it is unknown."""
+        return self.router.get_model(model_name)
+    
+    def load_and_prepare_data(self, csv_path: str=None) -> pd.DataFrame:
+        """Load CSV and derive date parts commonly used in charts (cached as Arrow IPC).
+        
+        Defaults to dataset_path, looked up in dataset/ unless it is an existing path.
+        """
+        if csv_path is None:
+            csv_path = self.dataset_path if os.path.exists(self.dataset_path) else os.path.join(os.getcwd(), "dataset", self.dataset_path)
+        self.csv_path = csv_path
+        self.loader = IncrementalLoader(csv_path, self.sales_cube, self.ingest_mode, self.ingest_chunksize)
+        self.loader.load()
+        self._describe_data()
+        return self.df
+
+    def refresh_data(self) -> dict:
+        """Ingest rows appended to the CSV since the last load; a truncated or rewritten file is reloaded."""
+        if self.loader is None:
+            self.load_and_prepare_data()
+            return {"mode": "reload", "new_rows": self.loader.rows}
+        with self.tracer.span("refresh_data") as span:
+            refreshed = self.loader.refresh()
+            span.set(**refreshed)
+            if refreshed["mode"] != "unchanged":
+                print(f"Dataset refresh ({refreshed['mode']}): {refreshed['new_rows']} new rows, {self.loader.rows} in total")
+                self._describe_data()
+            return refreshed
+
+    @property
+    def df(self) -> pd.DataFrame | None:
+        """The prepared frame; appended rows are concatenated onto it on first use after a refresh."""
+        return self.loader.frames["df"] if self.loader is not None else None
+
+    @property
+    def cube(self) -> pd.DataFrame | None:
+        return self.loader.cube if self.loader is not None else None
+
+    def _describe_data(self) -> None:
+        # The profile is updated from the appended rows alone, so this does not touch the full frame
+        self.schema_text = format_profile(self.loader.profile)
+
+        if self.cube is not None:
+            self.cube_text = make_cube_text(self.cube)
+            if self.ingest_mode == "cube":
+                self.cube_text += "\n    Row-level data is not loaded: 'df' is this same cube, so aggregate 'price' and 'count' from it."
+
+    async def check_excusion_python_code(self, python_code_v1: str=None, name: str="generate_chart", out_path_name: str=None):
+        """Execute generated code, asking the repair agent for fixes until it runs cleanly.
+        
+        Each round requests repair_candidates fixes concurrently and keeps the first one that executes,
+        cancelling the rest. Fixes that worked are memoised on the error signature and tried first.
+        Returns (code, chart path); the path is the render cache object when the render was cached.
+        """
+        if python_code_v1 is None:
+            return None, None
+        
+        if out_path_name is None:
+            out_path_name = make_out_path_name(name)
+        with self.tracer.span("check_execution", chart=name) as span:
+            return await self._check_excusion_python_code(python_code_v1, out_path_name, span)
+    
+    async def _check_excusion_python_code(self, python_code_v1: str, out_path_name: str, span):
+        try:
+            chart_path = await self.execute_python_code(python_code_v1, out_path_name)
+            span.set(repair_rounds=0)
+            return python_code_v1, chart_path
+        except Exception as e:
+            exception_error = str(e)
+            exception_traceback = getattr(e, "traceback", None)
+        
+        for recheck_code_count in range(1, self.max_repair_rounds + 1):
+            span.set(repair_rounds=recheck_code_count)
+            signature = repair_signature(python_code_v1, exception_error, out_path_name)
             
-            await self.check_excusion_python_code(reflect_python_code_agent_result.final_output.python_code.strip(), name="reflect_chart")
+            memo_entry = self.repair_memo.get(signature)
+            if memo_entry is not None:
+                self.repair_memo.move_to_end(signature)
+                memo_code = memo_entry.replace(OUT_PATH_PLACEHOLDER, out_path_name)
+                try:
+                    chart_path = await self.execute_python_code(memo_code, out_path_name)
+                    span.add("memo_hits")
+                    print(f"[ +++++++++++++++ Reused memoised fix for : {exception_error} +++++++++++++++ ]")
+                    return memo_code, chart_path
+                except Exception:
+                    # Another query may already have replaced or evicted it
+                    if self.repair_memo.get(signature) is memo_entry:
+                        del self.repair_memo[signature]
             
-            email_sender_agent = await self.send_email_agent(report = report, 
-                                                             model_name = self.get_model("ollama3.2"),) ## ollama3.2 qwen3-coder qwen3
+            print(f"[ ============= Number of attempts to fix code bugs : {recheck_code_count} ============= ]")
+            span.add("repair_attempts", self.repair_candidates)
+            fixed_code, error, chart_path = await self.repair_round(python_code_v1, exception_error, exception_traceback, out_path_name, recheck_code_count)
             
-            messages = [{"role": "user", "content": content_}]
-            await Runner.run(email_sender_agent, messages)
-            await self.agentic_mcp_server.cleanup()
+            if error is None:
+                self.repair_memo[signature] = fixed_code.replace(out_path_name, OUT_PATH_PLACEHOLDER)
+                self.repair_memo.move_to_end(signature)
+                while len(self.repair_memo) > self.repair_memo_size:
+                    self.repair_memo.popitem(last=False)
+                print(f"[ +++++++++++++++ Bug code fixed attempts : {recheck_code_count} +++++++++++++++ ]")
+                print(f" ====== Fixed code: ====== \n <<<<< \n {fixed_code} \n >>>>> ]")
+                return fixed_code, chart_path
             
-        except Exception as e:
-            print(f"Error running {self.name}: {e}")
-    
-    def get_model(self, model_name: str) -> Agent:
-        return model_client_name_dict.get(model_name, model_client_name_dict["ollama"])
+            python_code_v1 = fixed_code
+            exception_error = str(error)
+            exception_traceback = getattr(error, "traceback", None)
+        
+        span.set(gave_up=True)
+        print(f"[ --------------- Quit attempts to fix code bugs : {self.max_repair_rounds} --------------- ]")
+        return python_code_v1, out_path_name
     
-    def load_and_prepare_data(self, csv_path: str=os.path.join(os.getcwd(),"dataset/coffee_sales.csv")) -> pd.DataFrame:
-        """Load CSV and derive date parts commonly used in charts."""
-        self.df = pd.read_csv(csv_path)
+    async def repair_round(self, buggy_code: str, error_message: str, traceback: str, out_path_name: str, round_number: int):
+        """Run one speculative repair round.
         
-        # Be tolerant if 'date' exists
-        if "date" in self.df.columns:
-            self.df["date"] = pd.to_datetime(self.df["date"], errors="coerce")
-            self.df["quarter"] = self.df["date"].dt.quarter
-            self.df["month"] = self.df["date"].dt.month
-            self.df["year"] = self.df["date"].dt.year
-        return self.df
-
-    async def check_excusion_python_code(self, python_code_v1: str=None, name: str="generate_chart"):
+        Returns (code, None, chart path) for the first candidate that executes cleanly, or the first
+        failing candidate's (code, exception, None) when none does.
+        """
         
-        exception_error = None
-        recheck_code = True
-        recheck_code_count = 0
+        async def candidate(index: int):
+            model_name = self.repair_models[index % len(self.repair_models)]
+            with self.tracer.span("repair.candidate", round=round_number, index=index + 1, repair_model=model_name) as span:
+                fixed_code = await self.check_python_code_agent(buggy_code=buggy_code, 
+                                                                model_name=model_name, 
+                                                                error_message=error_message, 
+                                                                traceback=traceback,
+                                                                out_path_name=out_path_name,
+                                                                attempt=f"{round_number}.{index + 1}")
+                try:
+                    chart_path = await self.execute_python_code(fixed_code, out_path_name)
+                except Exception as e:
+                    span.set(fixed=False)
+                    return fixed_code, e, None
+                span.set(fixed=True)
+                return fixed_code, None, chart_path
         
-        if python_code_v1 is not None:
-            dt = datetime.now()
-            name = f"{name}_{dt.strftime("%Y_%m_%d")}{dt.hour}{dt.minute}{dt.second}"
-            out_path_name=os.path.join(os.getcwd(),"out_puts",f"{name}.png")
-            while recheck_code:
+        with self.tracer.span("repair.round", round=round_number, candidates=self.repair_candidates):
+            return await self._gather_first_fix(candidate, buggy_code)
+    
+    async def _gather_first_fix(self, candidate, buggy_code: str):
+        tasks = [asyncio.create_task(candidate(index)) for index in range(self.repair_candidates)]
+        first_failure = None
+        try:
+            for next_done in asyncio.as_completed(tasks):
                 try:
-                    if recheck_code_count != 0:
-                        python_code_v1 = await self.check_python_code_agent(buggy_code=python_code_v1, 
-                                                                      model_name="qwen3-coder", 
-                                                                      error_message=exception_error, 
-                                                                      out_path_name=out_path_name)
-                        print(f"[ ============= Number of attempts to fix code bugs : {recheck_code_count} ============= ]")
-    
-                    self.extract_exc_python_code(python_code_v1)
-                    print(f"[ +++++++++++++++ Bug code fixed attempts : {recheck_code_count} +++++++++++++++ ]")
-                    print(f" ====== Fixed code: ====== \n <<<<< \n {python_code_v1} \n >>>>> ]")
-                    recheck_code = False
-                    
+                    fixed_code, error, chart_path = await next_done
                 except Exception as e:
-                    exception_error = str(e)
-                    recheck_code_count+=1
-                    if recheck_code_count>=50:
-                        recheck_code = False
-                        print(f"[ --------------- Quit attempts to fix code bugs : {recheck_code_count} --------------- ]")
-        return python_code_v1
+                    # The repair agent itself failed (e.g. invalid JSON); keep the code we had
+                    fixed_code, error, chart_path = buggy_code, e, None
+                if error is None:
+                    return fixed_code, None, chart_path
+                if first_failure is None:
+                    first_failure = (fixed_code, error, None)
+        finally:
+            for task in tasks:
+                task.cancel()
+        return first_failure
     
-    def extract_exc_python_code(self, python_code_v1: str):
-        code_v1 = re.search(r"<execute_python>([\s\S]*?)</execute_python>", python_code_v1)
+    async def execute_python_code(self, python_code_v1: str, out_path_name: str=None) -> str | None:
+        """Statically validate generated code, then run it in the sandbox workers when enabled, otherwise inline.
+        
+        Returns the chart path. Code already rendered against the same dataset is served from the render
+        cache: the path is then the stored object, and nothing is written to out_path_name.
+        """
+        with self.tracer.span("exec", backend="inline" if self.sandbox is None else "sandbox") as span:
+            return await self._execute_python_code(python_code_v1, out_path_name, span)
+    
+    async def _execute_python_code(self, python_code_v1: str, out_path_name: str, span) -> str | None:
+        code = extract_python_code(python_code_v1)
         
-        if self.df is None:
+        if self.loader is None:
             self.load_and_prepare_data()
         
-        if code_v1:
-            initial_code = code_v1.group(1).strip()
-            exec_globals = {"df": self.df}
-            exec(initial_code, exec_globals)
+        # Columns and fingerprint come from the loader, so cache hits and sandbox runs never build the full frame
+        provided_names = ["df", "cube"] if self.cube is not None else ["df"]
+        diagnostics = validate_chart_code(code, columns=self.loader.columns, out_path_name=out_path_name, provided_names=provided_names)
+        if diagnostics:
+            span.set(validation_errors=len(diagnostics))
+            raise ChartCodeValidationError(diagnostics)
+        
+        render_key = None
+        fingerprint = self.loader.fingerprint()
+        if out_path_name is not None and fingerprint is not None:
+            # The preparation version and ingest mode change what the same code renders
+            dataset_key = f"{fingerprint['sha256']}:v{CACHE_VERSION}:{self.ingest_mode}"
+            render_key = self.render_cache.make_key(code, out_path_name, dataset_key)
+            cached_path = self.render_cache.get(render_key)
+            span.set(render_cache_hit=cached_path is not None)
+            if cached_path is not None:
+                return cached_path
+        
+        if self.sandbox is None:
+            start = time.perf_counter()
+            try:
+                self.extract_exc_python_code(code)
+            finally:
+                span.set(exec_ms=round((time.perf_counter() - start) * 1000, 3))
         else:
-            exec_globals = {"df": self.df}
-            exec(python_code_v1, exec_globals)
+            # Workers catch up to the rows this process has ingested before running the job
+            result = await self.sandbox.submit(code, data_offset=self.loader.offset if self.loader is not None else None)
+            span.set(exec_ms=round(result.duration * 1000, 3), timed_out=result.timed_out)
+            if not result.ok:
+                raise CodeExecutionError(result)
+        
+        if out_path_name is None or not os.path.exists(out_path_name):
+            return None
+        if render_key is None:
+            return out_path_name
+        return self.render_cache.put(render_key, out_path_name)
+    
+    def exec_frames(self) -> dict:
+        """DataFrames made available to generated code."""
+        frames = {"df": self.df}
+        if self.cube is not None:
+            frames["cube"] = self.cube
+        return frames
+    
+    def extract_exc_python_code(self, python_code_v1: str):
+        if self.loader is None:
+            self.load_and_prepare_data()
+        
+        # Concurrent queries share self.df: like the sandbox workers, hand the code shallow copies
+        # under copy-on-write so in-place edits (set_index(inplace=True), df[col] = ...) stay local
+        with pd.option_context("mode.copy_on_write", True):
+            exec_globals = {name: frame.copy(deep=False) for name, frame in self.exec_frames().items()}
+            exec(extract_python_code(python_code_v1), exec_globals)
     
@@ -1,52 +1,115 @@
 import os
-from openai import AsyncOpenAI
+import asyncio
+from collections.abc import Mapping
 from dotenv import load_dotenv
 from utils.api_base_url import ApiConfig
-from agents import OpenAIChatCompletionsModel, set_tracing_disabled, set_default_openai_client, set_default_openai_api
+from agents import OpenAIChatCompletionsModel, set_tracing_disabled, set_default_openai_api
 
 set_default_openai_api("chat_completions")
 set_tracing_disabled(True)
 load_dotenv(override=True)
 
-anthropic_openai = AsyncOpenAI(api_key=os.getenv(ApiConfig.ANTHROPIC_API_KEY_NAME), base_url=ApiConfig.ANTHROPIC_BASE_URL)
-set_default_openai_client(anthropic_openai, use_for_tracing=False)
-anthropic_client = OpenAIChatCompletionsModel(model=ApiConfig.ANTHROPIC_MODEL, openai_client=anthropic_openai)
-
-gemini_openai = AsyncOpenAI(api_key=os.getenv(ApiConfig.GEMINI_API_KEY_NAME), base_url=ApiConfig.GEMINI_BASE_URL)
-set_default_openai_client(gemini_openai, use_for_tracing=False)
-gemini_client = OpenAIChatCompletionsModel(model=ApiConfig.GEMINI_MODEL, openai_client=gemini_openai)
-
-deepseek_openai = AsyncOpenAI(api_key=os.getenv(ApiConfig.DEEPSEEKAI_API_KEY_NAME), base_url=ApiConfig.DEEPSEEK_BASE_URL)
-set_default_openai_client(deepseek_openai, use_for_tracing=False)
-deepseek_client = OpenAIChatCompletionsModel(model=ApiConfig.DEEP_SEEK_MODEL, openai_client=deepseek_openai)
-
-# Base configuration for ollama openai local use
-ollama_openai = AsyncOpenAI(api_key=os.getenv(ApiConfig.OLLAMA_PUBLIC_KEY_NAME), base_url=ApiConfig.OLLAMA_BASE_URL)
-set_default_openai_client(ollama_openai, use_for_tracing=False)
-
-# client configuration for which ollama openai local use
-ollama_client = OpenAIChatCompletionsModel(model=ApiConfig.LLMA_32_MODEL, openai_client=ollama_openai)
-ollama3_client = OpenAIChatCompletionsModel(model=ApiConfig.LLMA_3_MODEL, openai_client=ollama_openai)
-qwen3_client = OpenAIChatCompletionsModel(model=ApiConfig.LLMA_QWEN_3_MODEL, openai_client=ollama_openai)
-
-# VISION and Multi Model name
-gemma4B_vclient = OpenAIChatCompletionsModel(model=ApiConfig.LLMA_GEMMA_4B_MODEL, openai_client=ollama_openai)
-gemma12B_vclient = OpenAIChatCompletionsModel(model=ApiConfig.LLMA_GEMMA_12B_MODEL, openai_client=ollama_openai)
-llava7B_vclient = OpenAIChatCompletionsModel(model=ApiConfig.LLMA_LLAVA_MODEL, openai_client=ollama_openai)
-qwen2_vclient = OpenAIChatCompletionsModel(model=ApiConfig.LLMA_QWEN2_MODEL, openai_client=ollama_openai)
-qwen3_coder_client = OpenAIChatCompletionsModel(model=ApiConfig.LLMA_QWEN3_CODER_MODEL, openai_client=ollama_openai)
-
-
-
-model_client_name_dict = {"ollama": ollama_client,
-              "ollama3": ollama3_client,
-              "qwen3": qwen3_client,
-              "gemma12B_v": gemma12B_vclient,
-              "gemma4B_v": gemma4B_vclient,
-              "llava7B_v": llava7B_vclient,
-              "qwen2_v": qwen2_vclient,
-              "anthropic": anthropic_client,
-              "deepseek":deepseek_client,
-              "gemini": gemini_client,
-              "qwen3-coder": qwen3_coder_client,
-              }
\ No newline at end of file
+# backend -> (base url, api key env var, default max concurrent requests)
+# Ollama serves one model at a time on the local box, so it gets a small limit
+BACKENDS = {"anthropic": (ApiConfig.ANTHROPIC_BASE_URL, ApiConfig.ANTHROPIC_API_KEY_NAME, 16),
+            "gemini": (ApiConfig.GEMINI_BASE_URL, ApiConfig.GEMINI_API_KEY_NAME, 16),
+            "deepseek": (ApiConfig.DEEPSEEK_BASE_URL, ApiConfig.DEEPSEEKAI_API_KEY_NAME, 16),
+            "ollama": (ApiConfig.OLLAMA_BASE_URL, ApiConfig.OLLAMA_PUBLIC_KEY_NAME, 4)}
+
+# registry name -> (backend, model id)
+MODEL_SPECS = {"ollama": ("ollama", ApiConfig.LLMA_32_MODEL),
+               "ollama3": ("ollama", ApiConfig.LLMA_3_MODEL),
+               "qwen3": ("ollama", ApiConfig.LLMA_QWEN_3_MODEL),
+               # VISION and Multi Model name
+               "gemma12B_v": ("ollama", ApiConfig.LLMA_GEMMA_12B_MODEL),
+               "gemma4B_v": ("ollama", ApiConfig.LLMA_GEMMA_4B_MODEL),
+               "llava7B_v": ("ollama", ApiConfig.LLMA_LLAVA_MODEL),
+               "qwen2_v": ("ollama", ApiConfig.LLMA_QWEN2_MODEL),
+               "anthropic": ("anthropic", ApiConfig.ANTHROPIC_MODEL),
+               "deepseek": ("deepseek", ApiConfig.DEEP_SEEK_MODEL),
+               "gemini": ("gemini", ApiConfig.GEMINI_MODEL),
+               "qwen3-coder": ("ollama", ApiConfig.LLMA_QWEN3_CODER_MODEL)}
+
+class LimitedChatCompletionsModel(OpenAIChatCompletionsModel):
+    """Chat completions model that waits for a slot of its backend's concurrency limit."""
+
+    def __init__(self, model: str, openai_client, semaphore: asyncio.Semaphore):
+        super().__init__(model=model, openai_client=openai_client)
+        self.semaphore = semaphore
+
+    async def get_response(self, *args, **kwargs):
+        async with self.semaphore:
+            return await super().get_response(*args, **kwargs)
+
+    async def stream_response(self, *args, **kwargs):
+        async with self.semaphore:
+            async for event in super().stream_response(*args, **kwargs):
+                yield event
+
+class ModelClientRegistry(Mapping):
+    """Name -> model mapping that builds clients on first use.
+
+    Every base URL gets one AsyncOpenAI client over one pooled keep-alive httpx transport, shared
+    by all models of that backend, and every backend a concurrency limit
+    (<BACKEND>_MAX_CONCURRENCY, e.g. OLLAMA_MAX_CONCURRENCY). Clients are bound to the event
+    loop that first uses them; call aclose() before starting another one.
+    """
+
+    def __init__(self, specs: dict[str, tuple[str, str]]=MODEL_SPECS, backends: dict[str, tuple[str, str, int]]=BACKENDS):
+        self.specs = specs
+        self.backends = backends
+        self.concurrency = {backend: int(os.getenv(f"{backend.upper()}_MAX_CONCURRENCY", limit))
+                            for backend, (_, _, limit) in backends.items()}
+        self._clients = {}
+        self._semaphores: dict[str, asyncio.Semaphore] = {}
+        self._models: dict[str, LimitedChatCompletionsModel] = {}
+
+    def __getitem__(self, name: str) -> LimitedChatCompletionsModel:
+        if name not in self._models:
+            backend, model_id = self.specs[name]
+            self._models[name] = LimitedChatCompletionsModel(model=model_id, openai_client=self.client(backend), semaphore=self.semaphore(backend))
+        return self._models[name]
+
+    def __iter__(self):
+        return iter(self.specs)
+
+    def __len__(self) -> int:
+        return len(self.specs)
+
+    def model_id(self, name: str) -> str:
+        """Underlying model id of a registry name, without building its client."""
+        return self.specs[name][1]
+
+    def backend_of(self, name: str) -> str:
+        return self.specs[name][0]
+
+    def semaphore(self, backend: str) -> asyncio.Semaphore:
+        if backend not in self._semaphores:
+            self._semaphores[backend] = asyncio.Semaphore(self.concurrency[backend])
+        return self._semaphores[backend]
+
+    def client(self, backend: str):
+        base_url, api_key_name, _ = self.backends[backend]
+        if base_url not in self._clients:
+            import httpx
+            from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+            connections = max(limit for name, limit in self.concurrency.items() if self.backends[name][0] == base_url)
+            http_client = DefaultAsyncHttpxClient(limits=httpx.Limits(max_connections=connections,
+                                                                      max_keepalive_connections=connections,
+                                                                      keepalive_expiry=float(os.getenv("LLM_KEEPALIVE_SECONDS", "60"))),
+                                                  timeout=httpx.Timeout(float(os.getenv("LLM_HTTP_TIMEOUT", "600")), connect=10.0))
+            # Ollama ignores the key, but the client refuses to start without one
+            api_key = os.getenv(api_key_name) or ("ollama" if backend == "ollama" else None)
+            self._clients[base_url] = AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=http_client)
+        return self._clients[base_url]
+
+    async def aclose(self) -> None:
+        """Close the pooled transports and forget the clients built on them."""
+        clients = list(self._clients.values())
+        self._clients.clear()
+        self._models.clear()
+        self._semaphores.clear()
+        await asyncio.gather(*(client.close() for client in clients), return_exceptions=True)
+
+model_client_name_dict = ModelClientRegistry()
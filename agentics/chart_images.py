@@ -0,0 +1,109 @@
+import os
+import math
+import hashlib
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+from utils.utils import iter_base64
+from utils.dataset_cache import hash_file
+
+load_dotenv(override=True)
+
+# Vision encoders bill an image by patches: tokens ~= width * height / patch_px ** 2
+VISION_TOKEN_BUDGET = int(os.getenv("VISION_TOKEN_BUDGET", "768"))
+VISION_PATCH_PX = int(os.getenv("VISION_PATCH_PX", "28"))
+VISION_IMAGE_FORMAT = os.getenv("VISION_IMAGE_FORMAT", "JPEG")
+VISION_JPEG_QUALITY = int(os.getenv("VISION_JPEG_QUALITY", "85"))
+CHART_IMAGE_CACHE_DIR = os.getenv("CHART_IMAGE_CACHE_DIR", os.path.join(os.getcwd(), ".cache", "chart_images"))
+
+def thumbnail_size(width: int, height: int, token_budget: int, patch_px: int) -> tuple[int, int]:
+    """Largest size with the same aspect ratio that fits token_budget patches.
+
+    Sides are rounded down to whole patches, so no partially filled patch is billed.
+    """
+    max_pixels = token_budget * patch_px * patch_px
+    scale = min(1.0, math.sqrt(max_pixels / (width * height)))
+    return (max(patch_px, int(width * scale) // patch_px * patch_px),
+            max(patch_px, int(height * scale) // patch_px * patch_px))
+
+class ChartImageEncoder:
+    """Turns rendered charts into small data URLs for vision models.
+
+    The chart is downscaled to the token budget and recompressed. Its base64 text is streamed
+    into CHART_IMAGE_CACHE_DIR/<key>.b64, keyed on the chart's content hash and the encoding
+    settings, so the same chart is never encoded twice. The most recent data URLs are also
+    kept in memory. encode is safe to call from several threads (see DataProcessingAgentic.encode_chart).
+    """
+
+    def __init__(self, token_budget: int=VISION_TOKEN_BUDGET, patch_px: int=VISION_PATCH_PX,
+                 image_format: str=VISION_IMAGE_FORMAT, quality: int=VISION_JPEG_QUALITY,
+                 cache_dir: str=CHART_IMAGE_CACHE_DIR, max_memory_items: int=32):
+        self.token_budget = token_budget
+        self.patch_px = patch_px
+        self.image_format = image_format.upper()
+        self.quality = quality
+        self.cache_dir = cache_dir
+        self.max_memory_items = max_memory_items
+        self._memory: OrderedDict[str, str] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @property
+    def media_type(self) -> str:
+        return "image/jpeg" if self.image_format in ("JPEG", "JPG") else f"image/{self.image_format.lower()}"
+
+    def make_key(self, path: str) -> str:
+        settings = f"{self.token_budget}:{self.patch_px}:{self.image_format}:{self.quality}"
+        return hashlib.sha256(f"{hash_file(path)}\0{settings}".encode("utf-8")).hexdigest()
+
+    def _render(self, path: str, b64_path: str) -> tuple[int, int]:
+        """Downscale and recompress path, streaming its base64 text into b64_path; return the new size."""
+        from io import BytesIO
+        from PIL import Image
+
+        with Image.open(path) as image:
+            size = thumbnail_size(image.width, image.height, self.token_budget, self.patch_px)
+            # reducing_gap shrinks by whole factors first, which is much faster on 300-dpi charts
+            thumb = image.convert("RGB").resize(size, Image.LANCZOS, reducing_gap=3.0) if size != image.size else image.convert("RGB")
+
+        buffer = BytesIO()
+        options = {"quality": self.quality, "optimize": True} if self.image_format in ("JPEG", "JPG") else {"optimize": True}
+        thumb.save(buffer, format=self.image_format, **options)
+        buffer.seek(0)
+
+        tmp_path = f"{b64_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="ascii") as file:
+            for chunk in iter_base64(buffer):
+                file.write(chunk)
+        os.replace(tmp_path, b64_path)
+        return size
+
+    def encode(self, path: str) -> dict:
+        """Return {"data_url", "key", "cache_hit", "encoded_bytes"} for the chart at path."""
+        key = self.make_key(path)
+        with self._lock:
+            data_url = self._memory.get(key)
+            if data_url is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+        if data_url is not None:
+            return {"data_url": data_url, "key": key, "cache_hit": True, "encoded_bytes": len(data_url)}
+
+        b64_path = os.path.join(self.cache_dir, f"{key}.b64")
+        cache_hit = os.path.exists(b64_path)
+        if not cache_hit:
+            self._render(path, b64_path)
+
+        with open(b64_path, "r", encoding="ascii") as file:
+            data_url = f"data:{self.media_type};base64,{file.read()}"
+        with self._lock:
+            if cache_hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+            self._memory[key] = data_url
+            while len(self._memory) > self.max_memory_items:
+                self._memory.popitem(last=False)
+        return {"data_url": data_url, "key": key, "cache_hit": cache_hit, "encoded_bytes": len(data_url)}
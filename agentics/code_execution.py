@@ -0,0 +1,229 @@
+from __future__ import annotations
+
+import io
+import os
+import re
+import time
+import asyncio
+import traceback
+import contextlib
+import multiprocessing
+from typing import TYPE_CHECKING
+
+# Workers import this module too; they only exchange plain dicts, so pydantic stays out of them
+if TYPE_CHECKING:
+    from .out_puts import CodeExecutionResult
+
+try:
+    import resource
+except ImportError:  # not available on Windows, memory limits are skipped there
+    resource = None
+
+def extract_python_code(text: str) -> str:
+    """Return the code inside <execute_python> tags, or the text itself when there are no tags."""
+    match = re.search(r"<execute_python>([\s\S]*?)</execute_python>", text)
+    return match.group(1).strip() if match else text
+
+class CodeExecutionError(Exception):
+    """Raised when generated code fails; keeps the structured result for the repair prompt."""
+
+    def __init__(self, result: CodeExecutionResult):
+        super().__init__(result.error)
+        self.result = result
+        self.traceback = result.traceback
+
+# === Worker process ===
+def _address_space_bytes() -> int | None:
+    try:
+        with open("/proc/self/statm", "r") as file:
+            return int(file.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+def _execute_job(code: str, frames: dict, saved_files: list, memory_limit_mb: float | None) -> dict:
+    import matplotlib.pyplot as plt
+
+    saved_files.clear()
+    output = io.StringIO()
+    old_limit = None
+    # The limit is relative to what the warm worker already maps (interpreter, pandas, df)
+    if memory_limit_mb and resource is not None:
+        baseline = _address_space_bytes()
+        if baseline is not None:
+            old_limit = resource.getrlimit(resource.RLIMIT_AS)
+            resource.setrlimit(resource.RLIMIT_AS, (baseline + int(memory_limit_mb * 1024 * 1024), old_limit[1]))
+
+    start = time.perf_counter()
+    error = tb = None
+    try:
+        with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+            # Shallow copies + copy-on-write: generated code cannot change the shared frames
+            exec_globals = {name: frame.copy(deep=False) for name, frame in frames.items()}
+            exec(code, {**exec_globals, "__name__": "__main__"})
+    except BaseException as e:
+        error = f"{type(e).__name__}: {e}"
+        tb = traceback.format_exc()
+    finally:
+        if old_limit is not None:
+            resource.setrlimit(resource.RLIMIT_AS, old_limit)
+        plt.close("all")
+
+    return {"ok": error is None,
+            "stdout": output.getvalue(),
+            "error": error,
+            "traceback": tb,
+            "files": [path for path in dict.fromkeys(saved_files) if os.path.exists(path)],
+            "duration": time.perf_counter() - start}
+
+def _worker_main(conn, csv_path: str, sales_cube: bool, ingest_mode: str="frame", chunksize: int | None=None) -> None:
+    """Load pandas, matplotlib (Agg) and the prepared DataFrame (and cube) once, then run jobs until told to stop."""
+    os.environ["MPLBACKEND"] = "Agg"
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.figure
+    # Loaded here, not on the first job, so warm workers pay no import cost per job
+    import matplotlib.pyplot
+    import pandas as pd
+    from utils.dataset_cache import IncrementalLoader
+
+    pd.set_option("mode.copy_on_write", True)
+    loader = IncrementalLoader(csv_path, sales_cube, ingest_mode, chunksize)
+    frames = loader.load()
+
+    # Record every figure saved by a job so results can list the produced files
+    saved_files = []
+    savefig = matplotlib.figure.Figure.savefig
+    def recording_savefig(self, fname, *args, **kwargs):
+        if isinstance(fname, (str, os.PathLike)):
+            saved_files.append(os.path.abspath(os.fspath(fname)))
+        return savefig(self, fname, *args, **kwargs)
+    matplotlib.figure.Figure.savefig = recording_savefig
+
+    conn.send(("ready", os.getpid()))
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            break
+        if job is None:
+            break
+        data_offset = job.get("data_offset")
+        if data_offset is not None:
+            # Ingest exactly up to the parent's offset so both sides see the same rows (a stat when unchanged)
+            loader.refresh(until=data_offset)
+            frames = loader.frames
+        conn.send(_execute_job(job["code"], frames, saved_files, job.get("memory_limit_mb")))
+
+# === Pool ===
+class _Worker:
+
+    def __init__(self, ctx, csv_path: str, sales_cube: bool, ingest_mode: str="frame", chunksize: int | None=None):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn, csv_path, sales_cube, ingest_mode, chunksize), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def kill(self) -> None:
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join(timeout=5)
+        self.conn.close()
+
+class CodeSandbox:
+    """Pool of warm worker processes that execute generated chart code off the event loop.
+
+    Each worker has pandas, matplotlib (Agg backend) and the prepared DataFrame (plus the sales
+    cube when enabled) already loaded.
+    A job that exceeds its wall-clock limit, or is cancelled, kills its worker, which is then
+    replaced by a fresh one.
+    """
+
+    def __init__(self, csv_path: str, workers: int=2, timeout: float=120, memory_limit_mb: float | None=None, startup_timeout: float=120, sales_cube: bool=False,
+                 ingest_mode: str="frame", chunksize: int | None=None):
+        self.csv_path = csv_path
+        self.sales_cube = sales_cube
+        self.ingest_mode = ingest_mode
+        self.chunksize = chunksize
+        self.workers = workers
+        self.timeout = timeout
+        self.memory_limit_mb = memory_limit_mb
+        self.startup_timeout = startup_timeout
+        self._ctx = multiprocessing.get_context("spawn")
+        self._idle: asyncio.Queue[_Worker] | None = None
+        self._all: set[_Worker] = set()
+
+    async def start(self) -> "CodeSandbox":
+        if self._idle is not None:
+            return self
+        self._idle = asyncio.Queue()
+        await asyncio.gather(*(self._spawn() for _ in range(self.workers)))
+        print(f"Code sandbox started with {self.workers} workers")
+        return self
+
+    async def _spawn(self) -> None:
+        worker = _Worker(self._ctx, self.csv_path, self.sales_cube, self.ingest_mode, self.chunksize)
+        self._all.add(worker)
+        try:
+            ready = await asyncio.to_thread(worker.conn.poll, self.startup_timeout)
+            if not ready:
+                raise TimeoutError(f"sandbox worker did not start within {self.startup_timeout}s")
+            worker.conn.recv()
+        except BaseException:
+            self._discard(worker)
+            raise
+        self._idle.put_nowait(worker)
+
+    def _discard(self, worker: _Worker) -> None:
+        self._all.discard(worker)
+        worker.kill()
+
+    def _replace(self, worker: _Worker) -> None:
+        self._discard(worker)
+        task = asyncio.get_running_loop().create_task(self._spawn())
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    async def submit(self, code: str, timeout: float | None=None, memory_limit_mb: float | None=None, data_offset: int | None=None) -> CodeExecutionResult:
+        """Run code in an idle worker and return its structured result.
+
+        data_offset is the CSV byte offset the caller has ingested; the worker refreshes to it first.
+        """
+        from .out_puts import CodeExecutionResult
+
+        if self._idle is None:
+            await self.start()
+        timeout = self.timeout if timeout is None else timeout
+        memory_limit_mb = self.memory_limit_mb if memory_limit_mb is None else memory_limit_mb
+
+        worker = await self._idle.get()
+        start = time.perf_counter()
+        try:
+            worker.conn.send({"code": code, "memory_limit_mb": memory_limit_mb, "data_offset": data_offset})
+            done = await asyncio.to_thread(worker.conn.poll, timeout)
+            if not done:
+                self._replace(worker)
+                return CodeExecutionResult(ok=False,
+                                           error=f"TimeoutError: execution exceeded {timeout}s",
+                                           duration=time.perf_counter() - start,
+                                           timed_out=True)
+            result = CodeExecutionResult(**worker.conn.recv())
+        except asyncio.CancelledError:
+            # The job may still be writing files; kill it so a cancelled candidate cannot overwrite a chart
+            self._replace(worker)
+            raise
+        except (EOFError, OSError) as e:
+            self._replace(worker)
+            return CodeExecutionResult(ok=False,
+                                       error=f"WorkerCrashed: sandbox worker died ({e or type(e).__name__})",
+                                       duration=time.perf_counter() - start)
+        self._idle.put_nowait(worker)
+        return result
+
+    async def close(self) -> None:
+        for worker in list(self._all):
+            try:
+                worker.conn.send(None)
+            except OSError:
+                pass
+            await asyncio.to_thread(worker.process.join, 5)
+            self._discard(worker)
+        self._idle = None
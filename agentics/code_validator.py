@@ -0,0 +1,191 @@
+import ast
+import difflib
+import builtins
+
+# Hints for the aliases generated chart code uses most often
+IMPORT_HINTS = {"pd": "import pandas as pd",
+                "plt": "import matplotlib.pyplot as plt",
+                "np": "import numpy as np",
+                "mdates": "import matplotlib.dates as mdates",
+                "ticker": "import matplotlib.ticker as ticker"}
+
+# Calls whose arguments name columns of the frame they are called on
+COLUMN_ARGUMENTS = {"groupby": ("by",), "sort_values": ("by",), "pivot_table": ("index", "columns", "values"), "value_counts": ("subset",)}
+
+# Methods that return a subset of the rows with the same columns
+ROW_METHODS = {"copy", "query", "dropna", "sort_values", "sort_index", "head", "tail", "fillna", "drop_duplicates"}
+
+# Methods that change the columns of the frame they are called on, whatever their arguments
+INPLACE_COLUMN_METHODS = {"insert", "pop"}
+
+class ChartCodeValidationError(Exception):
+    """Raised when static checks reject generated code before it is executed."""
+
+    def __init__(self, diagnostics: list[str]):
+        super().__init__("Static validation failed:\n" + "\n".join(f"- {diagnostic}" for diagnostic in diagnostics))
+        self.diagnostics = diagnostics
+        self.traceback = None
+
+def _root_name(node: ast.AST) -> str | None:
+    """Return the variable a chain like df[mask].groupby('x')['y'] starts from."""
+    while isinstance(node, (ast.Attribute, ast.Subscript, ast.Call)):
+        node = node.func if isinstance(node, ast.Call) else node.value
+    return node.id if isinstance(node, ast.Name) else None
+
+def _string_constants(node: ast.AST) -> list[ast.Constant]:
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return [node]
+    if isinstance(node, (ast.List, ast.Tuple)):
+        return [elt for elt in node.elts if isinstance(elt, ast.Constant) and isinstance(elt.value, str)]
+    return []
+
+def _bound_names(tree: ast.AST) -> set[str]:
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and isinstance(node.ctx, (ast.Store, ast.Del)):
+            names.add(node.id)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            for alias in node.names:
+                names.add(alias.asname or alias.name.split(".")[0])
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names.add(node.name)
+        elif isinstance(node, ast.arg):
+            names.add(node.arg)
+        elif isinstance(node, ast.ExceptHandler) and node.name:
+            names.add(node.name)
+        elif isinstance(node, (ast.Global, ast.Nonlocal)):
+            names.update(node.names)
+        elif isinstance(node, (ast.MatchAs, ast.MatchStar)) and node.name:
+            names.add(node.name)
+    return names
+
+def _check_names(tree: ast.AST, provided_names: set[str]) -> list[str]:
+    if any(isinstance(node, ast.ImportFrom) and any(alias.name == "*" for alias in node.names) for node in ast.walk(tree)):
+        return []
+
+    defined = _bound_names(tree) | provided_names | set(dir(builtins))
+    diagnostics, reported = [], set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load) and node.id not in defined and node.id not in reported:
+            reported.add(node.id)
+            hint = f"; add '{IMPORT_HINTS[node.id]}'" if node.id in IMPORT_HINTS else ""
+            diagnostics.append(f"NameError at line {node.lineno}: '{node.id}' is used but never imported or defined{hint}")
+    return diagnostics
+
+def _keeps_columns(node: ast.AST) -> bool:
+    """True for df, a row filter or subscript of it (df[mask], df[['a', 'b']]) and row-only methods on those."""
+    if isinstance(node, ast.Name):
+        return node.id == "df"
+    if isinstance(node, ast.Subscript):
+        return _keeps_columns(node.value)
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr in ROW_METHODS:
+        return _keeps_columns(node.func.value)
+    return False
+
+def _mutates_in_place(node: ast.AST) -> bool:
+    """True for df.insert(...)/df.pop(...), any df method called with inplace=True, and df.columns = ..."""
+    if isinstance(node, ast.Attribute) and isinstance(node.ctx, ast.Store):
+        return isinstance(node.value, ast.Name) and node.value.id == "df"
+    if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)):
+        return False
+    if not (isinstance(node.func.value, ast.Name) and node.func.value.id == "df"):
+        return False
+    if node.func.attr in INPLACE_COLUMN_METHODS:
+        return True
+    return any(keyword.arg == "inplace" and not (isinstance(keyword.value, ast.Constant) and keyword.value.value is False)
+               for keyword in node.keywords)
+
+def _check_columns(tree: ast.AST, columns: set[str]) -> list[str]:
+    # Columns the code adds itself, e.g. df['total'] = ...
+    known = set(columns)
+    rebinds = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Subscript) and isinstance(node.ctx, ast.Store) and _root_name(node) == "df":
+            known.update(constant.value for constant in _string_constants(node.slice))
+        elif isinstance(node, (ast.Assign, ast.AnnAssign)):
+            targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+            rebinds.extend((target, node.value) for target in targets if isinstance(target, ast.Name) and target.id == "df")
+
+    # df rebound to anything but a filter of itself (groupby/reset_index, rename, merge, a new frame, a loop
+    # variable...) or changed in place (rename(..., inplace=True), insert, eval(..., inplace=True)) may
+    # have different columns than the ones we know; do not guess them
+    plain = {id(target) for target, value in rebinds if value is not None and _keeps_columns(value)}
+    if any((isinstance(node, ast.Name) and node.id == "df" and isinstance(node.ctx, ast.Store) and id(node) not in plain)
+           or _mutates_in_place(node) for node in ast.walk(tree)):
+        return []
+
+    referenced = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Subscript) and isinstance(node.ctx, ast.Load):
+            value = node.value
+            direct = isinstance(value, ast.Name) and value.id == "df"
+            filtered = isinstance(value, ast.Subscript) and isinstance(value.value, ast.Name) and value.value.id == "df"
+            grouped = isinstance(value, ast.Call) and isinstance(value.func, ast.Attribute) and value.func.attr == "groupby" and _root_name(value) == "df"
+            if direct or filtered or grouped:
+                referenced.extend(_string_constants(node.slice))
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr in COLUMN_ARGUMENTS and _root_name(node.func.value) == "df":
+            if node.func.attr == "groupby" and node.args:
+                referenced.extend(_string_constants(node.args[0]))
+            for keyword in node.keywords:
+                if keyword.arg in COLUMN_ARGUMENTS[node.func.attr]:
+                    referenced.extend(_string_constants(keyword.value))
+
+    diagnostics, reported = [], set()
+    for constant in referenced:
+        if constant.value in known or constant.value in reported:
+            continue
+        reported.add(constant.value)
+        close = difflib.get_close_matches(constant.value, sorted(known), n=1)
+        hint = f"; did you mean '{close[0]}'?" if close else ""
+        diagnostics.append(f"KeyError at line {constant.lineno}: column '{constant.value}' is not in df{hint}. Available columns: {', '.join(sorted(columns))}")
+    return diagnostics
+
+def _check_output_contract(tree: ast.AST, out_path_name: str | None) -> list[str]:
+    # Resolve simple `name = "literal"` assignments so savefig(out_path) can be checked too
+    literals = {}
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Assign) and isinstance(node.value, ast.Constant) and isinstance(node.value.value, str):
+            for target in node.targets:
+                if isinstance(target, ast.Name):
+                    literals[target.id] = node.value.value
+
+    diagnostics, savefig_targets, savefig_found = [], [], False
+    for node in ast.walk(tree):
+        if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)):
+            continue
+        if node.func.attr == "savefig":
+            savefig_found = True
+            target = node.args[0] if node.args else next((keyword.value for keyword in node.keywords if keyword.arg == "fname"), None)
+            if isinstance(target, ast.Constant) and isinstance(target.value, str):
+                savefig_targets.append((target.value, node.lineno))
+            elif isinstance(target, ast.Name) and target.id in literals:
+                savefig_targets.append((literals[target.id], node.lineno))
+            else:
+                # A computed path cannot be checked statically; accept it
+                savefig_targets.append((None, node.lineno))
+        elif node.func.attr == "show" and _root_name(node.func) == "plt":
+            diagnostics.append(f"Line {node.lineno}: plt.show() must not be called; save the figure and call plt.close()")
+        elif node.func.attr in ("read_csv", "read_excel", "read_parquet") and _root_name(node.func) == "pd":
+            diagnostics.append(f"Line {node.lineno}: do not read files with pd.{node.func.attr}(); use the provided DataFrame 'df'")
+
+    if not savefig_found:
+        target = f" to '{out_path_name}'" if out_path_name else ""
+        diagnostics.append(f"No savefig() call: the chart must be saved{target} with dpi=300")
+    elif out_path_name and all(path is not None and path != out_path_name for path, _ in savefig_targets):
+        path, lineno = savefig_targets[0]
+        diagnostics.append(f"Line {lineno}: savefig() writes to '{path}' but the chart must be saved to '{out_path_name}'")
+    return diagnostics
+
+def validate_chart_code(code: str, columns=(), out_path_name: str | None=None, provided_names=("df",)) -> list[str]:
+    """Statically check generated chart code; return human-readable diagnostics (empty when it looks runnable)."""
+    try:
+        tree = ast.parse(code)
+    except SyntaxError as e:
+        line = f": {e.text.strip()}" if e.text else ""
+        return [f"SyntaxError at line {e.lineno}, column {e.offset}: {e.msg}{line}"]
+
+    diagnostics = _check_names(tree, set(provided_names))
+    if columns is not None and len(columns):
+        diagnostics += _check_columns(tree, set(columns))
+    diagnostics += _check_output_contract(tree, out_path_name)
+    return diagnostics
@@ -31,101 +31,91 @@ def image_generate(pathsogens:str, prompts:list[str], caption:str, path:str)->st
     return prompt_
 
 
-def code_bug_fixer(out_path_name: str, buggy_code: str, error_message:str, traceback:str=None):
+# Shared, byte-identical blocks come first in every prompt so backends with prefix caching can
+# reuse them; the dataset description follows, and the per-request parts (instruction, code,
+# error, output path) always come last.
+CODE_REQUIREMENTS = """Requirements for the code:
+1. The DataFrame is already loaded as 'df'; do not read files.
+2. Use pandas and matplotlib only (no seaborn), with all necessary imports.
+3. Add a clear title, axis labels, and a legend if needed.
+4. Save the figure to the path given at the end with dpi=300.
+5. Never call plt.show(); finish with plt.close().
+6. Pass observed=True to every groupby() and pivot_table(), so categorical columns only yield groups that occur."""
+
+# Added when the code model has the sql_query tool
+SQL_TOOL_NOTE = """Before writing the code you may call the sql_query tool (read-only SQLite over a 'sales' table with the
+same rows as df) to check values, date ranges or totals. The code itself must still compute from 'df'."""
+
+# Used when no live frame is available to describe
+DEFAULT_SCHEMA_TEXT = """- date: datetime64 (ISO dates), time: string HH:MM, timestamp: datetime64 (date + time)
+- cash_type: 'card' or 'cash', card: string, coffee_name: string
+- price: float
+- quarter: 1-4, month: 1-12, year: YYYY"""
+
+def dataset_block(schema_text: str=None, cube_text: str=None) -> str:
+    block = f"DATAFRAME 'df':\n{schema_text or DEFAULT_SCHEMA_TEXT}"
+    return f"{block}\n\n{cube_text}" if cube_text else block
+
+def code_bug_fixer(out_path_name: str, buggy_code: str, error_message:str, traceback:str=None, cube_text:str=None, schema_text:str=None):
     
-    prompt = f"""You are a Python debugging expert. Fix the code error.
+    prompt = f"""You are a Python debugging expert. Fix the code error while preserving the original visualization intent.
 
-    BUGGY CODE:
-    {buggy_code}
+OUTPUT FORMAT (strict, no text outside the JSON objects):
+Line 1: {{"diagnosis": "root cause and fix applied"}}
+Line 2: {{"python_code": "<execute_python>\\n# fixed code\\n</execute_python>"}}
 
-    ERROR:
-    {error_message}
+{CODE_REQUIREMENTS}
 
-    {f"FULL TRACEBACK:\\n{traceback}" if traceback else ""}
+{dataset_block(schema_text, cube_text)}
 
-    OUTPUT FORMAT (strict):
-    Line 1: {{"diagnosis": "root cause and fix applied"}}
-    Line 2: {{"python_code": "<execute_python>\\n# fixed code\\n</execute_python>"}}
+BUGGY CODE:
+{buggy_code}
 
-    CONSTRAINTS:
-    - Include all imports
-    - pandas/matplotlib only
-    - df exists (columns: date, time, cash_type, card, price, coffee_name, quarter, month, year)
-    - Save to '{out_path_name}', dpi=300
-    - End with plt.close()
-    - No extra text outside JSON objects
-
-    Preserve the original visualization intent while fixing the bug.
-    """
+ERROR:
+{error_message}
+{f"\nFULL TRACEBACK:\n{traceback}" if traceback else ""}
+Save the figure to '{out_path_name}' with dpi=300."""
     return prompt
 
 def reflect_on_chart_and_improve(
     out_path_name: str,
     python_code_v1: str,  
-) -> tuple[str, str]:
+    cube_text: str = None,
+    schema_text: str = None,
+) -> str:
 
     prompt = f"""You are a data visualization expert. Critique the attached chart and original code 
-                against the instruction, then provide improved matplotlib code.
-
-    ORIGINAL CODE (for reference):
-    {python_code_v1}
-
-    OUTPUT FORMAT (strict - no deviations):
-    Line 1: {{"feedback": "your critique here"}}
-    Line 2: {{"python_code": "<execute_python>\\n# your code here\\n</execute_python>"}}
-
-    REQUIREMENTS:
-    - Include ALL necessary imports (pandas, matplotlib, etc.)
-    - Use pandas/matplotlib only (no seaborn)
-    - Assume df exists (do NOT read files)
-    - Save to '{out_path_name}' with dpi=300
-    - End with plt.close() (never plt.show())
-    - No markdown, backticks, or extra text outside the two JSON objects
-
-    AVAILABLE COLUMNS:
-    - date (M/D/YY), time (HH:MM)
-    - cash_type (card/cash), card (string)
-    - price (float), coffee_name (string)
-    - quarter (1-4), month (1-12), year (YYYY)
-    """
+against the instruction, then provide improved matplotlib code.
+
+OUTPUT FORMAT (strict, no markdown, backticks or text outside the two JSON objects):
+Line 1: {{"feedback": "your critique here"}}
+Line 2: {{"python_code": "<execute_python>\\n# your code here\\n</execute_python>"}}
+
+{CODE_REQUIREMENTS}
+
+{dataset_block(schema_text, cube_text)}
+
+ORIGINAL CODE (for reference):
+{python_code_v1}
+
+Save the figure to '{out_path_name}' with dpi=300."""
     return prompt
 
    
-def build_chart_code(instruction: str, out_path_name: str) -> str:
+def build_chart_code(instruction: str, out_path_name: str, cube_text: str = None, schema_text: str = None, sql_tool: bool = False) -> str:
     """Build Python code to make a plot with matplotlib using tag-based wrapping."""
 
-    prompt = f"""
-    You are a data visualization expert.
-    Return your answer *strictly* in this format:
-
-    {{"python_code": "<execute_python> # valid python code here </execute_python>"}}
-
-    Do not add explanations, only the tags and the code.
-
-    The code should create a visualization from a DataFrame 'df' with these columns:
-    - date (M/D/YY)
-    - time (HH:MM)
-    - cash_type (card or cash)
-    - card (string)
-    - price (number)
-    - coffee_name (string)
-    - quarter (1-4)
-    - month (1-12)
-    - year (YYYY)
-
-    User instruction: {instruction}
-
-    Requirements for the code:
-    1. Assume the DataFrame is already loaded as 'df'.
-    2. Use matplotlib for plotting.
-    3. Add clear title, axis labels, and legend if needed.
-    4. Save the figure as '{out_path_name}' with dpi=300.
-    5. Do not call plt.show().
-    6. Close all plots with plt.close().
-    7. Add all necessary import python statements.
-    
-    Respond in this format:
-    {{"python_code": "<execute_python> # valid python code her </execute_python>"}}"""
+    prompt = f"""You are a data visualization expert. Write matplotlib code for the user instruction at the end.
+
+Return your answer *strictly* in this format, without explanations:
+{{"python_code": "<execute_python> # valid python code here </execute_python>"}}
+
+{CODE_REQUIREMENTS}
+{f"\n{SQL_TOOL_NOTE}\n" if sql_tool else ""}
+{dataset_block(schema_text, cube_text)}
+
+User instruction: {instruction}
+Save the figure to '{out_path_name}' with dpi=300."""
     
     return prompt
 
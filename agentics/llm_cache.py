@@ -0,0 +1,166 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+from dotenv import load_dotenv
+from agents import Agent, Runner
+
+load_dotenv(override=True)
+
+# Tools without side effects: an agent that only has these is cached like one without tools
+READ_ONLY_TOOLS = {"sql_query", "sql_schema"}
+
+class CachedRunResult:
+    """Minimal stand-in for agents.RunResult returned on a cache hit."""
+
+    def __init__(self, final_output):
+        self.final_output = final_output
+
+class LLMResponseCache:
+    """Content-addressed on-disk cache for Runner.run results.
+
+    Entries are keyed on the agent instructions, the input messages, the model name and the
+    output_type JSON schema, stored one JSON file per key, expired after a TTL and evicted in
+    least-recently-used order once the entry count or total size goes over the limits.
+    """
+
+    def __init__(self,
+                 cache_dir: str=os.getenv("LLM_CACHE_DIR", os.path.join(os.getcwd(), ".cache", "llm_responses")),
+                 ttl_seconds: float=float(os.getenv("LLM_CACHE_TTL_SECONDS", 7 * 24 * 3600)),
+                 max_entries: int=int(os.getenv("LLM_CACHE_MAX_ENTRIES", 1000)),
+                 max_bytes: int=int(os.getenv("LLM_CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+                 bypass: bool=os.getenv("LLM_CACHE_BYPASS", "0").lower() in ("1", "true", "yes")):
+        self.cache_dir = cache_dir
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.bypass = bypass
+        self.hits = 0
+        self.misses = 0
+        self._in_flight: dict[str, dict] = {}
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(agent: Agent, messages) -> str:
+        """Hash everything that determines the model response."""
+        model = agent.model
+        model_name = model if isinstance(model, str) else getattr(model, "model", type(model).__name__)
+        output_type = agent.output_type
+        output_schema = output_type.model_json_schema() if hasattr(output_type, "model_json_schema") else str(output_type)
+        payload = {"instructions": agent.instructions,
+                   "messages": messages,
+                   "model": model_name,
+                   "output_schema": output_schema}
+        if agent.tools:
+            payload["tools"] = sorted(tool.name for tool in agent.tools)
+        payload = json.dumps(payload, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def is_cacheable(self, agent: Agent) -> bool:
+        """Agents with MCP servers or other tools may cause side effects (e.g. sending an email), so they always run.
+
+        Only the tools in READ_ONLY_TOOLS are exempt.
+        """
+        return (not self.bypass and not agent.mcp_servers and isinstance(agent.instructions, str)
+                and all(getattr(tool, "name", None) in READ_ONLY_TOOLS for tool in agent.tools))
+
+    def get(self, key: str, output_type=None):
+        path = os.path.join(self.cache_dir, f"{key}.json")
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                entry = json.load(file)
+        except (OSError, ValueError):
+            return None
+
+        if time.time() - entry["created"] > self.ttl_seconds:
+            self._remove(path)
+            return None
+
+        # Bump the access time used for LRU eviction
+        os.utime(path)
+        output = entry["output"]
+        return output_type.model_validate(output) if hasattr(output_type, "model_validate") else output
+
+    def put(self, key: str, output) -> None:
+        path = os.path.join(self.cache_dir, f"{key}.json")
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        value = output.model_dump() if hasattr(output, "model_dump") else output
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump({"created": time.time(), "output": value}, file)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self) -> None:
+        """Drop expired entries, then the least recently used ones until the cache fits its limits."""
+        entries = []
+        now = time.time()
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if not entry.name.endswith(".json"):
+                    continue
+                stat = entry.stat()
+                if now - stat.st_mtime > self.ttl_seconds:
+                    self._remove(entry.path)
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        entries.sort()
+        total_bytes = sum(size for _, size, _ in entries)
+        while entries and (len(entries) > self.max_entries or total_bytes > self.max_bytes):
+            _, size, path = entries.pop(0)
+            total_bytes -= size
+            self._remove(path)
+
+    def clear(self) -> None:
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if entry.name.endswith(".json"):
+                    self._remove(entry.path)
+
+    async def run(self, agent: Agent, messages, **kwargs):
+        """Drop-in replacement for Runner.run that serves identical requests from the cache."""
+        if not self.is_cacheable(agent):
+            return await Runner.run(agent, messages, **kwargs)
+
+        key = self.make_key(agent, messages)
+        output = self.get(key, agent.output_type)
+        if output is not None:
+            self.hits += 1
+            return CachedRunResult(output)
+
+        # Identical requests share one model call. It runs as a task owned by the cache, so a caller
+        # being cancelled (a hedge loser, a losing repair candidate) does not cancel the others;
+        # the call itself is only cancelled once its last caller has left.
+        flight = self._in_flight.get(key)
+        leader = flight is None
+        if leader:
+            self.misses += 1
+            flight = {"task": asyncio.create_task(self._run_and_store(key, agent, messages, kwargs)), "callers": 0}
+            self._in_flight[key] = flight
+            flight["task"].add_done_callback(lambda _: self._in_flight.pop(key) if self._in_flight.get(key) is flight else None)
+        else:
+            self.hits += 1
+
+        flight["callers"] += 1
+        try:
+            result = await asyncio.shield(flight["task"])
+        finally:
+            flight["callers"] -= 1
+            if flight["callers"] == 0 and not flight["task"].done():
+                flight["task"].cancel()
+                if self._in_flight.get(key) is flight:
+                    del self._in_flight[key]
+        return result if leader else CachedRunResult(result.final_output)
+
+    async def _run_and_store(self, key: str, agent: Agent, messages, kwargs: dict):
+        result = await Runner.run(agent, messages, **kwargs)
+        self.put(key, result.final_output)
+        return result
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,204 @@
+import time
+import asyncio
+from collections import deque
+from agents import Agent
+from .llm_cache import CachedRunResult
+from .tracing import percentile
+from .agents_client import model_client_name_dict
+
+# What each registered backend can be used for: 'code' writes/fixes chart code, 'vision' reads
+# chart images, 'email' needs reliable tool calling for the email MCP server
+MODEL_CAPABILITIES = {"ollama": {"code", "email"},
+                      "ollama3": {"code", "email"},
+                      "qwen3": {"code", "email"},
+                      "qwen3-coder": {"code", "email"},
+                      "gemma12B_v": {"vision", "code"},
+                      "gemma4B_v": {"vision"},
+                      "llava7B_v": {"vision"},
+                      "qwen2_v": {"vision"},
+                      "anthropic": {"code", "vision", "email"},
+                      "deepseek": {"code", "email"},
+                      "gemini": {"code", "vision", "email"}}
+
+class BackendStats:
+    """Rolling latency and error window for one backend."""
+
+    def __init__(self, window: int=50):
+        self.samples: deque[tuple[float, bool]] = deque(maxlen=window)
+        self.consecutive_failures = 0
+        self.last_failure = 0.0
+
+    def record(self, seconds: float, ok: bool) -> None:
+        self.samples.append((seconds, ok))
+        if ok:
+            self.consecutive_failures = 0
+        else:
+            self.consecutive_failures += 1
+            self.last_failure = time.monotonic()
+
+    def latency(self, q: float) -> float | None:
+        latencies = sorted(seconds for seconds, ok in self.samples if ok)
+        return percentile(latencies, q) if latencies else None
+
+    @property
+    def error_rate(self) -> float:
+        return sum(not ok for _, ok in self.samples) / len(self.samples) if self.samples else 0.0
+
+class ModelRouter:
+    """Routes agent steps over model_client_name_dict by capability, rolling latency and health.
+
+    run() starts the fastest healthy backend for a step. When hedging, a second backend is started
+    if the first has not answered within its own hedge_percentile latency, and whichever finishes
+    first wins; the other request is cancelled. A backend that raises is replaced by the next one.
+    Hedges only go to models served by another backend (backend_of): a second model on the slow
+    server would just make it swap models. Fallbacks try other backends first.
+    """
+
+    def __init__(self, models: dict=None, capabilities: dict[str, set[str]]=None, window: int=50,
+                 hedging: bool=True, hedge_percentile: float=90, min_samples: int=5,
+                 max_error_rate: float=0.5, max_consecutive_failures: int=3, cooldown_seconds: float=30):
+        self.models = models if models is not None else model_client_name_dict
+        self.capabilities = capabilities if capabilities is not None else MODEL_CAPABILITIES
+        self.window = window
+        self.hedging = hedging
+        self.hedge_percentile = hedge_percentile
+        self.min_samples = min_samples
+        self.max_error_rate = max_error_rate
+        self.max_consecutive_failures = max_consecutive_failures
+        self.cooldown_seconds = cooldown_seconds
+        self.stats: dict[str, BackendStats] = {}
+        self._warned: set[str] = set()
+
+    def resolve(self, model_name: str) -> str | None:
+        """Return the registry key for a key or an underlying model id such as 'llama3.2'."""
+        if model_name in self.models:
+            return model_name
+        # The lazy registry knows the ids without building every client
+        model_id = getattr(self.models, "model_id", lambda name: getattr(self.models[name], "model", None))
+        return next((name for name in self.models if model_id(name) == model_name), None)
+
+    def get_model(self, model_name: str):
+        name = self.resolve(model_name)
+        if name is None:
+            name = "ollama" if "ollama" in self.models else next(iter(self.models))
+            if model_name not in self._warned:
+                self._warned.add(model_name)
+                print(f"Unknown model {model_name!r}, falling back to {name!r}. Known models: {', '.join(self.models)}")
+        return self.models[name]
+
+    def backend_of(self, model_name: str) -> str:
+        """Server a registry name runs on; registries without backends treat every model as its own."""
+        backend_of = getattr(self.models, "backend_of", None)
+        return backend_of(model_name) if backend_of is not None else model_name
+
+    def record(self, model_name: str, seconds: float, ok: bool) -> None:
+        self.stats.setdefault(model_name, BackendStats(self.window)).record(seconds, ok)
+
+    def is_healthy(self, model_name: str) -> bool:
+        stats = self.stats.get(model_name)
+        if stats is None:
+            return True
+        if stats.consecutive_failures >= self.max_consecutive_failures:
+            # Give it another chance once the cooldown is over
+            return time.monotonic() - stats.last_failure > self.cooldown_seconds
+        return len(stats.samples) < self.min_samples or stats.error_rate <= self.max_error_rate
+
+    def rank(self, capability: str, models: list[str]=None, ordered: bool=False) -> list[str]:
+        """Candidates for a capability: healthy before unhealthy, then by median latency unless ordered.
+
+        Backends without samples keep their position after the measured ones, so the preferred
+        order decides until there is data.
+        """
+        resolved = (self.resolve(name) for name in (models or self.models))
+        names = [name for name in dict.fromkeys(resolved) if name is not None and capability in self.capabilities.get(name, set())]
+        if ordered:
+            return sorted(names, key=lambda name: not self.is_healthy(name))
+
+        def key(item):
+            position, name = item
+            stats = self.stats.get(name)
+            median = stats.latency(50) if stats is not None and len(stats.samples) >= self.min_samples else None
+            return (not self.is_healthy(name), median is None, median or 0.0, position)
+        return [name for _, name in sorted(enumerate(names), key=key)]
+
+    def hedge_delay(self, model_name: str) -> float | None:
+        stats = self.stats.get(model_name)
+        if stats is None or len(stats.samples) < self.min_samples:
+            return None
+        return stats.latency(self.hedge_percentile)
+
+    async def run(self, agent: Agent, messages, runner, capability: str, models: list[str]=None,
+                  ordered: bool=False, hedge: bool=True, fallback: bool=True):
+        """Run agent on the best backend for capability with runner(agent, messages).
+
+        Returns (result, agent actually used, route info). Steps with side effects should pass
+        hedge=False and fallback=False so a request is never sent twice.
+        """
+        candidates = self.rank(capability, models, ordered)
+        if not candidates:
+            raise ValueError(f"No model registered for capability {capability!r} among {models or list(self.models)}")
+
+        # Models on other backends go first, in rank order; the primary's backend only as a last resort
+        primary_backend = self.backend_of(candidates[0])
+        candidates = candidates[:1] + sorted(candidates[1:], key=lambda name: self.backend_of(name) == primary_backend)
+
+        pending: dict[asyncio.Task, tuple[str, Agent, float]] = {}
+        route = {"primary": candidates[0], "backend": primary_backend, "hedged": False, "fallbacks": 0}
+
+        def launch() -> None:
+            name = candidates.pop(0)
+            routed = agent.clone(model=self.models[name])
+            pending[asyncio.create_task(runner(routed, messages))] = (name, routed, time.perf_counter())
+
+        launch()
+        last_error = None
+        try:
+            while pending:
+                timeout = None
+                if (hedge and self.hedging and candidates and not route["hedged"] and len(pending) == 1
+                        and self.backend_of(candidates[0]) != primary_backend):
+                    name, _, started = next(iter(pending.values()))
+                    delay = self.hedge_delay(name)
+                    if delay is not None:
+                        timeout = max(0.0, started + delay - time.perf_counter())
+
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    route["hedged"] = True
+                    launch()
+                    continue
+
+                for task in done:
+                    name, routed, started = pending.pop(task)
+                    elapsed = time.perf_counter() - started
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        self.record(name, elapsed, ok=False)
+                        last_error = e
+                        print(f"Model {name!r} failed for {capability}: {e}")
+                        if fallback and candidates and not pending:
+                            route["fallbacks"] += 1
+                            launch()
+                        continue
+                    # Cache hits say nothing about the backend's latency
+                    if not isinstance(result, CachedRunResult):
+                        self.record(name, elapsed, ok=True)
+                    # The hedged loser took at least this long; keep it in its window so its tail stays visible
+                    for other_name, _, other_started in pending.values():
+                        self.record(other_name, time.perf_counter() - other_started, ok=True)
+                    route["model"] = name
+                    return result, routed, route
+            raise last_error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def snapshot(self) -> dict:
+        """Rolling p50/p95 latency, error rate and health per backend that has been used."""
+        return {name: {"samples": len(stats.samples),
+                       "p50_s": stats.latency(50),
+                       "p95_s": stats.latency(95),
+                       "error_rate": round(stats.error_rate, 3),
+                       "healthy": self.is_healthy(name)}
+                for name, stats in self.stats.items()}
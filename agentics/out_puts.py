@@ -11,4 +11,12 @@ class PythonCodeCheckedResult(BaseModel):
 class ReflectImprovedPythonCodeResult(BaseModel):
     feedback: str = Field(description="A valid JSON object with ONLY the 'feedback' field")
     python_code: str = Field(description="Generate Python code to make a plot with matplotlib using tag-based wrapping in <execute_python> # valid python code here </execute_python>")
-    
\ No newline at end of file
+    
+class CodeExecutionResult(BaseModel):
+    ok: bool = Field(description="True when the code ran without raising")
+    stdout: str = Field(default="", description="Captured stdout and stderr of the run")
+    error: str | None = Field(default=None, description="Exception message when the run failed")
+    traceback: str | None = Field(default=None, description="Formatted traceback when the run failed")
+    files: list[str] = Field(default_factory=list, description="Files written by savefig during the run")
+    duration: float = Field(default=0.0, description="Wall-clock seconds spent executing")
+    timed_out: bool = Field(default=False, description="True when the job was killed for exceeding its time limit")
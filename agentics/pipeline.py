@@ -0,0 +1,117 @@
+import time
+import asyncio
+
+STAGES = ("generate", "exec", "reflect", "reexec", "email")
+
+def _being_cancelled() -> bool:
+    """True when the running task itself was cancelled, not just handed a CancelledError by what it awaited."""
+    task = asyncio.current_task()
+    return task is not None and task.cancelling() > 0
+
+class StagePipeline:
+    """Runs queries through the agent's stages as separate worker pools joined by bounded queues.
+
+    generate -> exec -> reflect -> reexec -> email. Each stage has its own concurrency, so the
+    model backends (generate, reflect) and the render workers (exec, reexec) are busy at the same
+    time for different queries. A full queue makes the stage before it wait. The email stage
+    coalesces up to email_batch_size finished queries, waiting at most email_batch_seconds for
+    more, into one email.
+    """
+
+    def __init__(self, agentic, concurrency: dict[str, int]=None, queue_size: int=8,
+                 email_batch_size: int=8, email_batch_seconds: float=2.0):
+        self.agentic = agentic
+        # Render stages default to one worker per sandbox process; inline exec blocks the loop anyway
+        render_workers = max(1, agentic.sandbox_workers)
+        self.concurrency = {"generate": 4, "exec": render_workers, "reflect": 4, "reexec": render_workers, "email": 1}
+        self.concurrency.update(concurrency or {})
+        self.queue_size = queue_size
+        self.email_batch_size = email_batch_size
+        self.email_batch_seconds = email_batch_seconds
+
+    async def run(self, queries: list[str]) -> list[dict]:
+        """Run every query through the stages and return their results in input order.
+
+        The agent must already be set up; results carry the per-query latency_s.
+        """
+        stages = [stage for stage in STAGES if stage != "email" or self.agentic.send_email]
+        queues = {stage: asyncio.Queue(maxsize=self.queue_size) for stage in stages}
+        jobs = [{"index": index, "query": query, "done": asyncio.get_running_loop().create_future()}
+                for index, query in enumerate(queries)]
+
+        workers = []
+        for position, stage in enumerate(stages):
+            next_queue = queues[stages[position + 1]] if position + 1 < len(stages) else None
+            for _ in range(self.concurrency[stage]):
+                worker = self._email_worker(queues[stage]) if stage == "email" else self._worker(stage, queues[stage], next_queue)
+                workers.append(asyncio.create_task(worker))
+
+        async def feed():
+            for job in jobs:
+                job["started"] = time.perf_counter()
+                await queues[stages[0]].put(job)
+
+        feeder = asyncio.create_task(feed())
+        try:
+            await asyncio.gather(*(job["done"] for job in jobs))
+        finally:
+            feeder.cancel()
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(feeder, *workers, return_exceptions=True)
+        return [job["done"].result() for job in jobs]
+
+    async def _worker(self, stage: str, queue: asyncio.Queue, next_queue: asyncio.Queue | None) -> None:
+        step = getattr(self.agentic, f"{stage}_stage")
+        while True:
+            job = await queue.get()
+            try:
+                with self.agentic.tracer.span(f"stage.{stage}", job=job["index"], queued=queue.qsize()):
+                    await step(job)
+            except BaseException as e:
+                # Anything a step raises, CancelledError included, fails only that job; the worker
+                # goes on unless it is the one being cancelled
+                self._fail(job, stage, e)
+                if _being_cancelled():
+                    raise
+                continue
+            if next_queue is None:
+                self._finish(job)
+            else:
+                await next_queue.put(job)
+
+    async def _email_worker(self, queue: asyncio.Queue) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await queue.get()]
+            deadline = loop.time() + self.email_batch_seconds
+            while len(batch) < self.email_batch_size:
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), max(0.0, deadline - loop.time())))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                with self.agentic.tracer.span("stage.email", jobs=len(batch)):
+                    await self.agentic.email_stage(batch)
+            except BaseException as e:
+                for job in batch:
+                    self._fail(job, "email", e)
+                if _being_cancelled():
+                    raise
+                continue
+            for job in batch:
+                self._finish(job)
+
+    def _finish(self, job: dict) -> None:
+        if job["done"].done():
+            return
+        result = self.agentic.job_result(job)
+        result["latency_s"] = round(time.perf_counter() - job["started"], 3)
+        job["done"].set_result(result)
+
+    def _fail(self, job: dict, stage: str, error: BaseException) -> None:
+        if job["done"].done():
+            return
+        print(f"Error in stage {stage} for query {job['query']!r}: {error!r}")
+        job["done"].set_result({"query": job["query"], "status": "failure", "stage": stage, "message": str(error),
+                                "latency_s": round(time.perf_counter() - job["started"], 3)})
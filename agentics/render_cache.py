@@ -0,0 +1,80 @@
+import os
+import ast
+import json
+import shutil
+import hashlib
+from dotenv import load_dotenv
+from utils.dataset_cache import hash_file
+
+load_dotenv(override=True)
+
+OUT_PATH_PLACEHOLDER = "__OUT_PATH_NAME__"
+
+class RenderCache:
+    """Content-addressed store of rendered charts, keyed on normalized code plus the dataset fingerprint.
+
+    Rendered files live once under objects/<sha256>.<ext>; keys/<key>.json points a render key at
+    its object. Objects are copies, never links to the output files: a later write to an output
+    path (a late repair candidate, a re-render to the same path) must not change a stored chart.
+    Hits hand out the object path itself, so objects are stored read-only.
+    """
+
+    def __init__(self, cache_dir: str=os.getenv("RENDER_CACHE_DIR", os.path.join(os.getcwd(), ".cache", "renders"))):
+        self.cache_dir = cache_dir
+        self.objects_dir = os.path.join(cache_dir, "objects")
+        self.keys_dir = os.path.join(cache_dir, "keys")
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.keys_dir, exist_ok=True)
+
+    @staticmethod
+    def normalize_code(code: str, out_path_name: str) -> str:
+        """Drop comments/formatting and the run-specific output path so equivalent code hashes the same."""
+        code = code.replace(out_path_name, OUT_PATH_PLACEHOLDER)
+        try:
+            return ast.unparse(ast.parse(code))
+        except SyntaxError:
+            return code.strip()
+
+    def make_key(self, code: str, out_path_name: str, dataset_fingerprint: str) -> str:
+        payload = f"{dataset_fingerprint}\0{self.normalize_code(code, out_path_name)}"
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> str | None:
+        """Return the cached artifact path for a render key, if it is still on disk."""
+        try:
+            with open(os.path.join(self.keys_dir, f"{key}.json"), "r", encoding="utf-8") as file:
+                object_path = json.load(file)["object"]
+        except (OSError, ValueError, KeyError):
+            self.misses += 1
+            return None
+
+        if not os.path.exists(object_path):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return object_path
+
+    def put(self, key: str, rendered_path: str) -> str:
+        """Copy a freshly rendered file into the store and return the artifact path."""
+        digest = hash_file(rendered_path)
+        object_path = os.path.join(self.objects_dir, f"{digest}{os.path.splitext(rendered_path)[1]}")
+
+        # Identical bytes are stored once
+        if not os.path.exists(object_path):
+            _copy_atomic(rendered_path, object_path)
+
+        key_path = os.path.join(self.keys_dir, f"{key}.json")
+        tmp_path = f"{key_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump({"object": object_path}, file)
+        os.replace(tmp_path, key_path)
+        return object_path
+
+def _copy_atomic(source: str, destination: str) -> None:
+    """Copy to a temporary name and rename it into place read-only, so readers never see a partial file."""
+    tmp_path = f"{destination}.{os.getpid()}.tmp"
+    shutil.copyfile(source, tmp_path)
+    os.chmod(tmp_path, 0o444)
+    os.replace(tmp_path, destination)
@@ -0,0 +1,163 @@
+import os
+import uuid
+import asyncio
+from datetime import datetime
+from collections import OrderedDict
+from dotenv import load_dotenv
+from .agentic import DataProcessingAgentic
+
+load_dotenv(override=True)
+
+class ChartService:
+    """Keeps one DataProcessingAgentic warm and runs chart queries submitted to it as jobs.
+
+    setup() runs once at start, so the MCP server connections, model clients, prepared DataFrame
+    and caches are shared by every request. A bounded queue feeds max_concurrency workers; when
+    it is full, submit() raises asyncio.QueueFull so callers can push back on clients. Chart code
+    runs in sandbox_workers processes, so rendering never blocks the event loop serving HTTP.
+    """
+
+    def __init__(self, agentic: DataProcessingAgentic=None, max_concurrency: int=int(os.getenv("SERVICE_MAX_CONCURRENCY", "4")),
+                 queue_size: int=int(os.getenv("SERVICE_QUEUE_SIZE", "32")), max_finished_jobs: int=1000,
+                 sandbox_workers: int=int(os.getenv("SERVICE_SANDBOX_WORKERS", "2"))):
+        self.agentic = agentic if agentic is not None else DataProcessingAgentic(name="Data-Processing-Multi-Agent", sandbox_workers=sandbox_workers)
+        self.max_concurrency = max_concurrency
+        self.queue: asyncio.Queue[str] = asyncio.Queue(maxsize=queue_size)
+        self.max_finished_jobs = max_finished_jobs
+        self.jobs: OrderedDict[str, dict] = OrderedDict()
+        self.running = 0
+        self._workers: list[asyncio.Task] = []
+
+    async def start(self) -> "ChartService":
+        await self.agentic.setup()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.max_concurrency)]
+        return self
+
+    async def stop(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        await self.agentic.cleanup()
+
+    def submit(self, query: str) -> dict:
+        """Queue a chart query and return its job record; raises asyncio.QueueFull when saturated."""
+        job = {"job_id": uuid.uuid4().hex,
+               "query": query,
+               "status": "queued",
+               "submitted_at": datetime.now().isoformat(timespec="milliseconds")}
+        self.queue.put_nowait(job["job_id"])
+        self.jobs[job["job_id"]] = job
+        self._evict()
+        return job
+
+    def get(self, job_id: str) -> dict | None:
+        return self.jobs.get(job_id)
+
+    def stats(self) -> dict:
+        return {"queued": self.queue.qsize(),
+                "queue_size": self.queue.maxsize,
+                "running": self.running,
+                "max_concurrency": self.max_concurrency,
+                "jobs": len(self.jobs),
+                "backends": self.agentic.router.snapshot()}
+
+    async def _worker(self) -> None:
+        while True:
+            job_id = await self.queue.get()
+            job = self.jobs.get(job_id)
+            try:
+                if job is not None:
+                    await self._run_job(job)
+            finally:
+                self.queue.task_done()
+
+    async def _run_job(self, job: dict) -> None:
+        job["status"] = "running"
+        job["started_at"] = datetime.now().isoformat(timespec="milliseconds")
+        self.running += 1
+        try:
+            result = await self.agentic.run_query(job["query"])
+            job["status"] = result.get("status", "success")
+            job["result"] = result
+        except Exception as e:
+            print(f"Error running job {job['job_id']} ({job['query']!r}): {e}")
+            job["status"] = "failure"
+            job["message"] = str(e)
+        finally:
+            self.running -= 1
+            job["finished_at"] = datetime.now().isoformat(timespec="milliseconds")
+
+    def _evict(self) -> None:
+        """Forget the oldest finished jobs beyond max_finished_jobs; queued and running ones stay."""
+        finished = [job_id for job_id, job in self.jobs.items() if job["status"] not in ("queued", "running")]
+        for job_id in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+            del self.jobs[job_id]
+
+def create_app(service: ChartService):
+    """Starlette app over a ChartService.
+
+    POST /charts {"query": ...}  -> 202 with the job, 429 when the queue is full
+    GET  /charts/{job_id}        -> job status and, once finished, its result
+    GET  /charts/{job_id}/image  -> the rendered chart
+    GET  /health                 -> queue depth, running jobs and backend latencies
+    """
+    from contextlib import asynccontextmanager
+    from starlette.applications import Starlette
+    from starlette.responses import FileResponse, JSONResponse
+    from starlette.routing import Route
+
+    async def submit_chart(request):
+        try:
+            body = await request.json()
+        except ValueError:
+            body = None
+        query = body.get("query") if isinstance(body, dict) else None
+        if not isinstance(query, str) or not query.strip():
+            return JSONResponse({"status": "failure", "message": "body must be {\"query\": \"...\"}"}, status_code=400)
+        try:
+            job = service.submit(query.strip())
+        except asyncio.QueueFull:
+            return JSONResponse({"status": "failure", "message": "queue is full, retry later"}, status_code=429,
+                                headers={"Retry-After": "5"})
+        return JSONResponse(job, status_code=202, headers={"Location": f"/charts/{job['job_id']}"})
+
+    async def get_chart(request):
+        job = service.get(request.path_params["job_id"])
+        if job is None:
+            return JSONResponse({"status": "failure", "message": "unknown job"}, status_code=404)
+        return JSONResponse(job)
+
+    async def get_chart_image(request):
+        job = service.get(request.path_params["job_id"])
+        chart = (job or {}).get("result", {}).get("chart")
+        if chart is None or not os.path.exists(chart):
+            return JSONResponse({"status": "failure", "message": "no chart for this job"}, status_code=404)
+        return FileResponse(chart, media_type="image/png")
+
+    async def health(request):
+        return JSONResponse(service.stats())
+
+    @asynccontextmanager
+    async def lifespan(app):
+        await service.start()
+        try:
+            yield
+        finally:
+            await service.stop()
+
+    return Starlette(routes=[Route("/charts", submit_chart, methods=["POST"]),
+                             Route("/charts/{job_id}", get_chart, methods=["GET"]),
+                             Route("/charts/{job_id}/image", get_chart_image, methods=["GET"]),
+                             Route("/health", health, methods=["GET"])],
+                     lifespan=lifespan)
+
+async def serve(host: str=os.getenv("SERVICE_HOST", "127.0.0.1"), port: int=int(os.getenv("SERVICE_PORT", "8000")),
+                max_concurrency: int=int(os.getenv("SERVICE_MAX_CONCURRENCY", "4")), queue_size: int=int(os.getenv("SERVICE_QUEUE_SIZE", "32")),
+                sandbox_workers: int=int(os.getenv("SERVICE_SANDBOX_WORKERS", "2"))):
+    """Run the chart service over HTTP until interrupted."""
+    import uvicorn
+
+    service = ChartService(max_concurrency=max_concurrency, queue_size=queue_size, sandbox_workers=sandbox_workers)
+    server = uvicorn.Server(uvicorn.Config(create_app(service), host=host, port=port, log_level="info"))
+    await server.serve()
@@ -0,0 +1,188 @@
+import os
+import json
+import time
+import uuid
+import math
+import asyncio
+import contextlib
+import contextvars
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+
+# Span open in the current task; asyncio tasks copy it, so concurrent queries nest correctly
+_current_span: contextvars.ContextVar["Span | None"] = contextvars.ContextVar("current_span", default=None)
+
+class Span:
+    """One timed step of a run, nested under the span that was open when it started."""
+
+    def __init__(self, name: str, parent: "Span | None"=None, **attributes):
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent is not None else None
+        self.trace_id = parent.trace_id if parent is not None else uuid.uuid4().hex
+        self.depth = parent.depth + 1 if parent is not None else 0
+        self.attributes = dict(attributes)
+        self.status = "ok"
+        self.error = None
+        self.start_time = time.time()
+        self._start = time.perf_counter()
+        self.duration = None
+
+    def set(self, **attributes) -> "Span":
+        self.attributes.update(attributes)
+        return self
+
+    def add(self, name: str, value: float=1) -> "Span":
+        """Increment a numeric attribute, e.g. repair attempts or token counts."""
+        self.attributes[name] = self.attributes.get(name, 0) + value
+        return self
+
+    def finish(self, error: BaseException | None=None) -> None:
+        self.duration = time.perf_counter() - self._start
+        if error is not None:
+            self.status = "cancelled" if isinstance(error, asyncio.CancelledError) else "error"
+            self.error = f"{type(error).__name__}: {error}"
+
+    def to_dict(self) -> dict:
+        return {"trace_id": self.trace_id,
+                "span_id": self.span_id,
+                "parent_id": self.parent_id,
+                "name": self.name,
+                "start_time": self.start_time,
+                "duration_ms": round(self.duration * 1000, 3) if self.duration is not None else None,
+                "status": self.status,
+                "error": self.error,
+                "attributes": self.attributes}
+
+class Tracer:
+    """Records nested spans for every run and exports them as JSONL.
+
+    Spans of a trace are appended to export_path when its root span ends, and its summary table is
+    printed when print_summaries is set; summary() aggregates durations and token counts per span name.
+    """
+
+    def __init__(self, export_path: str=os.getenv("TRACE_EXPORT_PATH", os.path.join(os.getcwd(), "traces", "spans.jsonl")),
+                 enabled: bool=os.getenv("TRACE_DISABLED", "0") != "1",
+                 print_summaries: bool=True,
+                 max_finished_traces: int=50,
+                 record_memory: bool=False):
+        self.export_path = export_path
+        self.enabled = enabled
+        self.print_summaries = print_summaries
+        self.max_finished_traces = max_finished_traces
+        # Record the process RSS when each span ends (one /proc read per span)
+        self.record_memory = record_memory
+        self.spans: list[Span] = []
+        # Finished traces stay queryable for summary() but only the most recent ones are kept
+        self.finished_traces: OrderedDict[str, list[Span]] = OrderedDict()
+
+    @contextlib.contextmanager
+    def span(self, name: str, **attributes):
+        """Time the enclosed block as a child of the current span."""
+        if not self.enabled:
+            yield Span(name, **attributes)
+            return
+
+        span = Span(name, _current_span.get(), **attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.finish(e)
+            raise
+        else:
+            span.finish()
+        finally:
+            if self.record_memory:
+                span.set(rss_mb=round(rss_bytes() / 2**20, 1))
+            _current_span.reset(token)
+            self.spans.append(span)
+            if span.parent_id is None:
+                self._finish_trace(span.trace_id)
+
+    @staticmethod
+    def current() -> Span | None:
+        return _current_span.get()
+
+    def record_run_result(self, span: Span, agent, result) -> None:
+        """Attach the model name and token usage of a Runner.run result to a span."""
+        model = getattr(agent.model, "model", agent.model)
+        span.set(model=model if isinstance(model, str) or model is None else type(model).__name__)
+        usage = getattr(getattr(result, "context_wrapper", None), "usage", None)
+        if usage is None:
+            # Served from the response cache, no request was made
+            span.set(cached=True)
+            return
+        span.set(cached=False, requests=usage.requests, input_tokens=usage.input_tokens, output_tokens=usage.output_tokens)
+
+    def _finish_trace(self, trace_id: str) -> None:
+        self.finished_traces[trace_id] = [span for span in self.spans if span.trace_id == trace_id]
+        self.spans = [span for span in self.spans if span.trace_id != trace_id]
+        while len(self.finished_traces) > self.max_finished_traces:
+            self.finished_traces.popitem(last=False)
+        self.export(trace_id)
+        if self.print_summaries:
+            self.print_summary(trace_id)
+
+    def trace_spans(self, trace_id: str | None=None) -> list[Span]:
+        if trace_id is not None and trace_id in self.finished_traces:
+            return self.finished_traces[trace_id]
+        finished = [span for spans in self.finished_traces.values() for span in spans] if trace_id is None else []
+        return finished + [span for span in self.spans if trace_id is None or span.trace_id == trace_id]
+
+    def export(self, trace_id: str) -> None:
+        if not self.export_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.export_path)), exist_ok=True)
+            with open(self.export_path, "a", encoding="utf-8") as file:
+                for span in sorted(self.trace_spans(trace_id), key=lambda span: span.start_time):
+                    file.write(json.dumps(span.to_dict(), default=str) + "\n")
+        except OSError as e:
+            print(f"Could not export trace {trace_id}: {e}")
+
+    def summary(self, trace_id: str | None=None) -> str:
+        """Per span name: count, total/mean/p95/max duration, tokens and error count."""
+        groups: dict[str, list[Span]] = {}
+        trace_spans = self.trace_spans(trace_id)
+        for span in trace_spans:
+            if span.duration is not None:
+                groups.setdefault(span.name, []).append(span)
+
+        header = f"{'span':<28} {'count':>5} {'total s':>9} {'mean ms':>9} {'p95 ms':>9} {'max ms':>9} {'tok in':>8} {'tok out':>8} {'errors':>6}"
+        lines = [header, "-" * len(header)]
+        for name, spans in sorted(groups.items(), key=lambda item: -sum(span.duration for span in item[1])):
+            durations = sorted(span.duration * 1000 for span in spans)
+            total = sum(durations)
+            tokens_in = sum(span.attributes.get("input_tokens", 0) for span in spans)
+            tokens_out = sum(span.attributes.get("output_tokens", 0) for span in spans)
+            errors = sum(span.status != "ok" for span in spans)
+            lines.append(f"{name:<28} {len(spans):>5} {total / 1000:>9.2f} {total / len(spans):>9.1f} "
+                         f"{percentile(durations, 95):>9.1f} {durations[-1]:>9.1f} {tokens_in:>8} {tokens_out:>8} {errors:>6}")
+        repair_attempts = sum(span.attributes.get("repair_attempts", 0) for span in trace_spans)
+        cached = sum(span.attributes.get("cached") is True for span in trace_spans)
+        lines.append(f"repair attempts: {repair_attempts}, LLM responses served from cache: {cached}")
+        return "\n".join(lines)
+
+    def print_summary(self, trace_id: str | None=None) -> None:
+        print(f"\n====== Trace summary{f' {trace_id}' if trace_id else ''} ======\n{self.summary(trace_id)}")
+
+def rss_bytes() -> int:
+    """Current resident set size, or the peak when /proc is not available."""
+    try:
+        with open("/proc/self/statm", "r") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        import sys
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    """Nearest-rank percentile of already sorted values."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(q / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
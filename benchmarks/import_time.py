@@ -0,0 +1,78 @@
+"""Import-time budget for the CLI and worker entry points, measured with python -X importtime.
+
+    python -m benchmarks.import_time             # compare with benchmarks/import_budget.json, exit 1 when over
+    python -m benchmarks.import_time --update    # write the current timings (plus headroom) as the budget
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+# Entry points whose import cost short-lived processes pay on every start
+MODULES = ["main", "utils.utils", "utils.dataset_cache", "agentics.code_execution", "agentics.agentic"]
+BUDGET_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "import_budget.json")
+
+def measure(module: str) -> tuple[float, list[tuple[float, str]]]:
+    """Import module in a fresh interpreter; return its cumulative ms and the heaviest direct imports."""
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                               capture_output=True, text=True, cwd=os.getcwd())
+    if completed.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{completed.stderr[-2000:]}")
+
+    total, children, group = None, [], []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        milliseconds = int(cumulative) / 1000
+        depth = (len(name) - len(name.lstrip())) // 2
+        # Children are reported before their parent, so the group since the last top-level line is module's
+        if depth == 0:
+            if name.strip() == module:
+                total, children = milliseconds, group
+            group = []
+        elif depth == 1:
+            group.append((milliseconds, name.strip()))
+    return total or 0.0, sorted(children, reverse=True)[:5]
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeats", type=int, default=5, help="fresh interpreters per module; the median is used")
+    parser.add_argument("--budget", default=BUDGET_PATH)
+    parser.add_argument("--update", action="store_true", help="record the current timings as the budget")
+    parser.add_argument("--headroom", type=float, default=1.5, help="budget = measured median x headroom when updating")
+    args = parser.parse_args(argv)
+
+    budget = {}
+    if os.path.exists(args.budget) and not args.update:
+        with open(args.budget, "r", encoding="utf-8") as file:
+            budget = json.load(file)
+
+    over, measured = [], {}
+    print(f"{'module':<26} {'median ms':>10} {'budget ms':>10}  heaviest imports")
+    for module in MODULES:
+        runs = [measure(module) for _ in range(args.repeats)]
+        median = statistics.median(total for total, _ in runs)
+        measured[module] = median
+        limit = budget.get(module)
+        heaviest = ", ".join(f"{name} {milliseconds:.0f}" for milliseconds, name in runs[-1][1][:3])
+        print(f"{module:<26} {median:>10.1f} {limit if limit is not None else '-':>10}  {heaviest}")
+        if limit is not None and median > limit:
+            over.append(f"{module}: {median:.1f} ms > {limit} ms")
+
+    if args.update:
+        with open(args.budget, "w", encoding="utf-8") as file:
+            json.dump({module: round(value * args.headroom) for module, value in measured.items()}, file, indent=2)
+        print(f"Budget written to {args.budget}")
+        return 0
+
+    for line in over:
+        print(f"OVER BUDGET {line}")
+    return 1 if over else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,180 @@
+"""Offline end-to-end benchmark of DataProcessingAgentic against the stub model server.
+
+    python -m benchmarks.pipeline_benchmark --sizes 1,10 --concurrency 1,4 --queries 8
+    python -m benchmarks.pipeline_benchmark --output after.json --baseline before.json
+    python -m benchmarks.pipeline_benchmark --mode pipeline --sandbox-workers 2   # staged scheduler instead of run_batch
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+from .stub_model_server import StubModelServer
+
+QUERY = "Create a plot comparing Q1 coffee sales in 2024 and 2025 using the data in coffee_sales.csv."
+
+def make_dataset(source_csv: str, multiple: int, directory: str) -> str:
+    """Write the sample dataset repeated multiple times, streaming so large sizes stay cheap."""
+    path = os.path.join(directory, f"coffee_sales_x{multiple}.csv")
+    with open(source_csv, "r", encoding="utf-8") as file:
+        header, *rows = file.read().splitlines()
+    with open(path, "w", encoding="utf-8") as file:
+        file.write(header + "\n")
+        body = "\n".join(rows) + "\n"
+        for _ in range(multiple):
+            file.write(body)
+    return path
+
+def percentiles(values: list[float]) -> dict:
+    from agentics.tracing import percentile
+    values = sorted(values)
+    return {f"p{q}": round(percentile(values, q), 1) for q in (50, 95, 99)}
+
+def peak_rss_mb(who: int) -> float:
+    """High-water RSS from getrusage: this process, or the largest child it has waited for (sandbox workers, MCP servers)."""
+    import resource
+    peak = resource.getrusage(who).ru_maxrss
+    return round((peak if sys.platform == "darwin" else peak * 1024) / 2**20, 1)
+
+async def run_case(csv_path: str, concurrency: int, queries: int, sandbox_workers: int, work_dir: str, mode: str="batch") -> dict:
+    from agentics.agentic import DataProcessingAgentic
+    from agentics.chart_images import ChartImageEncoder
+    from agentics.llm_cache import LLMResponseCache
+    from agentics.render_cache import RenderCache
+    from agentics.tracing import Tracer
+
+    # Fresh caches per case: a warm cache would measure the cache, not the pipeline
+    case_dir = tempfile.mkdtemp(dir=work_dir)
+    tracer = Tracer(export_path=os.path.join(case_dir, "spans.jsonl"), print_summaries=False, record_memory=True)
+    agentic = DataProcessingAgentic(name="benchmark",
+                                    dataset_path=csv_path,
+                                    llm_cache=LLMResponseCache(cache_dir=os.path.join(case_dir, "llm"), bypass=True),
+                                    render_cache=RenderCache(cache_dir=os.path.join(case_dir, "renders")),
+                                    chart_images=ChartImageEncoder(cache_dir=os.path.join(case_dir, "chart_images")),
+                                    sandbox_workers=sandbox_workers,
+                                    tracer=tracer,
+                                    send_email=False)
+
+    start = time.perf_counter()
+    if mode == "pipeline":
+        # concurrency sizes the model stages; the render stages follow the sandbox workers
+        results = await agentic.run_pipeline([QUERY] * queries, stage_concurrency={"generate": concurrency, "reflect": concurrency})
+    else:
+        results = await agentic.run_batch([QUERY] * queries, max_concurrency=concurrency)
+    wall = time.perf_counter() - start
+    import resource
+    # The run closes its sandbox workers, so they are waited for and count as children here.
+    # Both are high-water marks for the whole benchmark process, not just this case
+    peak_rss = {"main": peak_rss_mb(resource.RUSAGE_SELF), "children": peak_rss_mb(resource.RUSAGE_CHILDREN)}
+
+    trace_id = next(reversed(tracer.finished_traces))
+    spans = tracer.trace_spans(trace_id)
+    stages = {}
+    for span in spans:
+        stages.setdefault(span.name, []).append(span)
+
+    # The pipeline has no per-query span; its results carry their own latency
+    latencies = [span.duration * 1000 for span in stages.get("run_query", [])] or [result["latency_s"] * 1000 for result in results]
+    return {"rows": len(agentic.df) if agentic.df is not None else None,
+            "mode": mode,
+            "concurrency": concurrency,
+            "queries": queries,
+            "failed": sum(result["status"] != "success" for result in results),
+            "wall_s": round(wall, 3),
+            "runs_per_s": round(queries / wall, 3),
+            "latency_ms": percentiles(latencies),
+            "repair_attempts": sum(span.attributes.get("repair_attempts", 0) for span in spans),
+            "peak_rss_mb": peak_rss,
+            # Main-process RSS sampled as each span ends: the largest sample, not a true peak
+            "stages": {name: {"count": len(items),
+                              **percentiles([span.duration * 1000 for span in items]),
+                              "max_rss_mb": max(span.attributes.get("rss_mb", 0) for span in items)}
+                       for name, items in stages.items()}}
+
+def print_case(case: dict) -> None:
+    latency = case["latency_ms"]
+    print(f"\n=== {case['mode']} rows={case['rows']} concurrency={case['concurrency']} queries={case['queries']} ===")
+    print(f"runs/s {case['runs_per_s']:.2f}  wall {case['wall_s']:.2f}s  failed {case['failed']}  repair attempts {case['repair_attempts']}  "
+          f"latency p50/p95/p99 {latency['p50']:.0f}/{latency['p95']:.0f}/{latency['p99']:.0f} ms")
+    print(f"peak rss main {case['peak_rss_mb']['main']:.1f} MB  largest child {case['peak_rss_mb']['children']:.1f} MB")
+    print(f"  {'stage':<20} {'count':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'end rss MB':>12}")
+    for name, stage in sorted(case["stages"].items(), key=lambda item: -item[1]["p95"]):
+        print(f"  {name:<20} {stage['count']:>5} {stage['p50']:>9.1f} {stage['p95']:>9.1f} {stage['p99']:>9.1f} {stage['max_rss_mb']:>12.1f}")
+
+def compare(cases: list[dict], baseline_path: str, tolerance: float) -> list[str]:
+    """Return regressions against a previous --output file: lower runs/s or higher p95 beyond tolerance."""
+    with open(baseline_path, "r", encoding="utf-8") as file:
+        baseline = {(case.get("mode", "batch"), case["rows"], case["concurrency"]): case for case in json.load(file)["cases"]}
+
+    regressions = []
+    for case in cases:
+        before = baseline.get((case["mode"], case["rows"], case["concurrency"]))
+        if before is None:
+            continue
+        label = f"{case['mode']} rows={case['rows']} concurrency={case['concurrency']}"
+        if case["runs_per_s"] < before["runs_per_s"] * (1 - tolerance):
+            regressions.append(f"{label}: runs/s {before['runs_per_s']:.2f} -> {case['runs_per_s']:.2f}")
+        if case["latency_ms"]["p95"] > before["latency_ms"]["p95"] * (1 + tolerance):
+            regressions.append(f"{label}: p95 {before['latency_ms']['p95']:.0f} -> {case['latency_ms']['p95']:.0f} ms")
+    return regressions
+
+async def main(args) -> int:
+    stub = StubModelServer(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, bug_rate=args.bug_rate, seed=args.seed).start()
+    # Must be set before agentics is imported: the model clients read it at import time
+    os.environ["OLLAMA_BASE_URL"] = stub.base_url
+    for key in ("OLLAMA_PUBLIC_KEY", "OPENAI_API_KEY", "GEMINI_API_KEY", "ANTHROPIC_API_KEY", "DEEPSEEKAI_API_KEY"):
+        os.environ.setdefault(key, "benchmark")
+
+    cases = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        os.environ["CHART_OUTPUT_DIR"] = work_dir
+        os.environ["DATASET_CACHE_DIR"] = os.path.join(work_dir, "datasets")
+        try:
+            for multiple in args.sizes:
+                csv_path = make_dataset(args.dataset, multiple, work_dir)
+                for concurrency in args.concurrency:
+                    case = await run_case(csv_path, concurrency, args.queries, args.sandbox_workers, work_dir, args.mode)
+                    case["dataset_multiple"] = multiple
+                    print_case(case)
+                    cases.append(case)
+        finally:
+            stub.stop()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump({"settings": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")}, "cases": cases}, file, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        regressions = compare(cases, args.baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+        print(f"No regressions beyond {args.tolerance:.0%} against {args.baseline}")
+    return 0
+
+def as_ints(text: str) -> list[int]:
+    return [int(value) for value in text.split(",") if value]
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dataset", default=os.path.join(os.getcwd(), "dataset", "coffee_sales.csv"))
+    parser.add_argument("--sizes", type=as_ints, default=[1, 10], help="dataset sizes as multiples of --dataset, e.g. 1,10,100")
+    parser.add_argument("--concurrency", type=as_ints, default=[1, 4], help="max_concurrency levels for run_batch")
+    parser.add_argument("--queries", type=int, default=8, help="queries per case")
+    parser.add_argument("--latency-ms", type=float, default=200, help="mean stub model latency")
+    parser.add_argument("--jitter-ms", type=float, default=50)
+    parser.add_argument("--bug-rate", type=float, default=0.2, help="share of generated code that fails and needs a repair")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--sandbox-workers", type=int, default=0, help="0 executes inline")
+    parser.add_argument("--mode", choices=["batch", "pipeline"], default="batch", help="run_batch or the staged run_pipeline")
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--baseline", help="previous --output file; exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown before a case counts as a regression")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parse_args())))
@@ -0,0 +1,140 @@
+import re
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Runs cleanly against the prepared coffee_sales frame; {title} keeps every render unique
+CHART_CODE = """import matplotlib.pyplot as plt
+sales = df[df['quarter'] == 1].groupby(['month', 'year'], observed=True)['price'].sum().unstack('year')
+ax = sales.plot(kind='{kind}', figsize=(8, 5))
+ax.set_title('{title}')
+ax.set_xlabel('Month')
+ax.set_ylabel('Sales')
+plt.tight_layout()
+plt.savefig('{out_path_name}', dpi=300)
+plt.close()"""
+
+# Passes static validation but fails at runtime, so the repair loop is exercised
+BUGGY_KIND = "barz"
+
+class StubModelServer:
+    """Local OpenAI-compatible /v1/chat/completions endpoint returning canned pipeline outputs.
+
+    The response shape follows the requested json_schema: chart code for generate, feedback plus
+    code for reflect, diagnosis plus code for repair, plain text otherwise (email). bug_rate of
+    the generate responses contain code that raises at runtime.
+    """
+
+    def __init__(self, host: str="127.0.0.1", port: int=0, latency_ms: float=200, jitter_ms: float=50, bug_rate: float=0.2, seed: int=0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.bug_rate = bug_rate
+        self.requests = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread = None
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.httpd.daemon_threads = True
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "StubModelServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _next(self) -> tuple[int, float, float]:
+        with self._lock:
+            self.requests += 1
+            delay = max(0.0, self._random.gauss(self.latency_ms, self.jitter_ms)) / 1000 if self.jitter_ms else self.latency_ms / 1000
+            return self.requests, delay, self._random.random()
+
+    def completion(self, request: dict) -> dict:
+        number, delay, draw = self._next()
+        time.sleep(delay)
+
+        messages = request.get("messages", [])
+        prompt = "\n".join(message["content"] for message in messages if isinstance(message.get("content"), str))
+        # The prompts end with "Save the figure to '<path>'"
+        match = re.search(r"Save the figure to '([^']+)'", prompt)
+        out_path_name = match.group(1) if match else "chart.png"
+        code = CHART_CODE.format(kind="bar", title=f"Q1 coffee sales by month #{number}", out_path_name=out_path_name)
+
+        schema = (request.get("response_format") or {}).get("json_schema", {}).get("schema", {})
+        properties = schema.get("properties", {})
+        if "feedback" in properties:
+            content = json.dumps({"feedback": "Add axis labels and a title.", "python_code": f"<execute_python>\n{code}\n</execute_python>"})
+        elif "diagnosis" in properties:
+            content = json.dumps({"diagnosis": "Invalid plot kind, use 'bar'.", "python_code": f"<execute_python>\n{code}\n</execute_python>"})
+        elif "python_code" in properties:
+            if draw < self.bug_rate:
+                code = code.replace("kind='bar'", f"kind='{BUGGY_KIND}'")
+            content = json.dumps({"python_code": f"<execute_python>\n{code}\n</execute_python>"})
+        else:
+            content = "Email sent."
+
+        prompt_tokens = len(prompt) // 4
+        completion_tokens = len(content) // 4
+        return {"id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model", "stub"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}}
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self._reply(404, {"error": {"message": f"unknown path {self.path}"}})
+                    return
+                length = int(self.headers.get("Content-Length", 0))
+                try:
+                    request = json.loads(self.rfile.read(length) or b"{}")
+                except ValueError:
+                    self._reply(400, {"error": {"message": "invalid JSON body"}})
+                    return
+                self._reply(200, server.completion(request))
+
+            def _reply(self, status: int, body: dict):
+                payload = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stub OpenAI-compatible model server for offline benchmarks")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--jitter-ms", type=float, default=50)
+    parser.add_argument("--bug-rate", type=float, default=0.2)
+    args = parser.parse_args()
+
+    stub = StubModelServer(port=args.port, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, bug_rate=args.bug_rate)
+    print(f"Stub model server on {stub.base_url} (OLLAMA_BASE_URL={stub.base_url})")
+    try:
+        stub.httpd.serve_forever()
+    except KeyboardInterrupt:
+        stub.stop()
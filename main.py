@@ -1,18 +1,66 @@
+import os
+import sys
 import asyncio
 from dotenv import load_dotenv
-from agentics.agentic import DataProcessingAgentic
 
 load_dotenv(override=True)
 
+# The agents SDK, pandas and the model clients are imported inside main(), after argument
+# handling and the prompt, so the CLI answers immediately and only loads what the run needs.
+
 async def main():
     print("====== Hello from data-processing-agent! ======")
-    query = input("What kind of crop disease would like to search and know about ?").strip()
-    dataProcessing = DataProcessingAgentic(name="Data-Processing-Multi-Agent")
-    
-    if not query:
-        await dataProcessing.run(query)
-    else:
-        await dataProcessing.run()
+
+    # Service mode: python main.py --serve [port] [max_concurrency] [sandbox_workers]
+    if len(sys.argv) > 1 and sys.argv[1] == "--serve":
+        from agentics.service import serve
+        from agentics.agents_client import model_client_name_dict
+
+        kwargs = {}
+        if len(sys.argv) > 2:
+            kwargs["port"] = int(sys.argv[2])
+        if len(sys.argv) > 3:
+            kwargs["max_concurrency"] = int(sys.argv[3])
+        if len(sys.argv) > 4:
+            kwargs["sandbox_workers"] = int(sys.argv[4])
+        try:
+            await serve(**kwargs)
+        finally:
+            await model_client_name_dict.aclose()
+        return
+
+    query = None
+    if len(sys.argv) <= 1:
+        query = input("What kind of crop disease would like to search and know about ?").strip()
+
+    from agentics.agentic import DataProcessingAgentic
+    from agentics.agents_client import model_client_name_dict
+
+    try:
+        # Batch mode: python main.py queries.jsonl [max_concurrency] [sandbox_workers] [--pipeline]
+        if len(sys.argv) > 1:
+            args = [arg for arg in sys.argv[1:] if arg != "--pipeline"]
+            max_concurrency = int(args[1]) if len(args) > 1 else 4
+            # Many queries render at once, so run their code in worker processes as the service does; 0 runs it inline
+            sandbox_workers = int(args[2]) if len(args) > 2 else int(os.getenv("BATCH_SANDBOX_WORKERS", "2"))
+            dataProcessing = DataProcessingAgentic(name="Data-Processing-Multi-Agent", sandbox_workers=sandbox_workers)
+            if "--pipeline" in sys.argv:
+                # Stages of different queries overlap; max_concurrency sizes the model stages
+                results = await dataProcessing.run_pipeline(args[0], stage_concurrency={"generate": max_concurrency, "reflect": max_concurrency})
+            else:
+                results = await dataProcessing.run_batch(args[0], max_concurrency=max_concurrency)
+            failed = [result for result in results if result["status"] != "success"]
+            print(f"====== Batch finished: {len(results) - len(failed)} succeeded, {len(failed)} failed ======")
+            return
+
+        dataProcessing = DataProcessingAgentic(name="Data-Processing-Multi-Agent")
+        if query:
+            await dataProcessing.run(query)
+        else:
+            await dataProcessing.run()
+    finally:
+        # Close the pooled model transports while their event loop is still running
+        await model_client_name_dict.aclose()
 
 if __name__ == "__main__":
     asyncio.run(main())
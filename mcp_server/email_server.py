@@ -1,7 +1,9 @@
 import os
+import time
 import uuid
-
+import asyncio
 import smtplib
+import threading
 from dotenv import load_dotenv
 from email.mime.text import MIMEText
 from datetime import datetime, timezone
@@ -12,6 +14,178 @@ from typing import Dict, List, Any, Optional
 
 load_dotenv(override=True)
 
+# SMTP target; point SMTP_HOST/SMTP_PORT at a local stand-in (e.g. aiosmtpd) with SMTP_STARTTLS=0 for tests
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "1") == "1"
+SMTP_USER = os.getenv("SMTP_USER", os.getenv("GMAIL_USER"))
+SMTP_PASSWORD = os.getenv("SMTP_PASSWORD", os.getenv("GMAIL_APP_PASSWORD"))
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "2"))
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "30"))
+# Connections idle for longer are checked with NOOP before reuse; servers drop idle sessions
+SMTP_IDLE_CHECK_SECONDS = float(os.getenv("SMTP_IDLE_CHECK_SECONDS", "30"))
+
+class SMTPConnectionPool:
+    """Long-lived, logged-in SMTP connections shared by all sends.
+
+    The connect/STARTTLS/login handshake is paid once per connection instead of once per
+    message. A connection that fails mid-send is dropped and the message retried once on a
+    fresh one. Methods block; the async tools run them in worker threads.
+    """
+
+    def __init__(self, host: str=SMTP_HOST, port: int=SMTP_PORT, starttls: bool=SMTP_STARTTLS, user: str=SMTP_USER,
+                 password: str=SMTP_PASSWORD, size: int=SMTP_POOL_SIZE, timeout: float=SMTP_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.starttls = starttls
+        self.user = user
+        self.password = password
+        self.size = size
+        self.timeout = timeout
+        self._idle: list[tuple[smtplib.SMTP, float]] = []
+        self._open = 0
+        self._condition = threading.Condition()
+
+    def _connect(self) -> smtplib.SMTP:
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            server.ehlo()
+            if self.starttls:
+                server.starttls()
+                server.ehlo()
+            if self.user and self.password:
+                server.login(self.user, self.password)
+        except Exception:
+            self._close(server)
+            raise
+        return server
+
+    @staticmethod
+    def _close(server: smtplib.SMTP) -> None:
+        try:
+            server.quit()
+        except Exception:
+            server.close()
+
+    def acquire(self, check: bool=False) -> smtplib.SMTP:
+        """Return an idle live connection, or open one when the pool is below its size (else wait).
+
+        Idle connections are probed with NOOP when stale, or always when check is set.
+        """
+        with self._condition:
+            while not self._idle and self._open >= self.size:
+                self._condition.wait()
+            if self._idle:
+                server, released_at = self._idle.pop()
+            else:
+                self._open += 1
+                server = released_at = None
+
+        if server is not None and (check or time.monotonic() - released_at > SMTP_IDLE_CHECK_SECONDS):
+            try:
+                if server.noop()[0] != 250:
+                    raise smtplib.SMTPServerDisconnected("NOOP failed")
+            except (smtplib.SMTPException, OSError):
+                self._close(server)
+                server = None
+        if server is None:
+            try:
+                server = self._connect()
+            except Exception:
+                self.discard(None)
+                raise
+        return server
+
+    def release(self, server: smtplib.SMTP) -> None:
+        with self._condition:
+            self._idle.append((server, time.monotonic()))
+            self._condition.notify()
+
+    def discard(self, server: smtplib.SMTP | None) -> None:
+        if server is not None:
+            self._close(server)
+        with self._condition:
+            self._open -= 1
+            self._condition.notify()
+
+    def _send_on(self, server: smtplib.SMTP | None, msg: MIMEText, recipients: list[str]) -> tuple[dict[str, str], smtplib.SMTP | None]:
+        """Send msg on server (acquiring one when None), reconnecting once on a dropped connection.
+
+        Returns the status per recipient and the connection still held by the caller, if any.
+        """
+        for attempt in range(2):
+            try:
+                if server is None:
+                    # After a dropped connection the other idle ones may be dead too
+                    server = self.acquire(check=attempt > 0)
+                refused = server.sendmail(msg["From"], recipients, msg.as_string())
+            except smtplib.SMTPRecipientsRefused as e:
+                refused = e.recipients
+            except (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, OSError) as e:
+                if server is not None:
+                    self.discard(server)
+                    server = None
+                if attempt == 1:
+                    return {recipient: f"failed: {e}" for recipient in recipients}, None
+                continue
+            except smtplib.SMTPException as e:
+                return {recipient: f"failed: {e}" for recipient in recipients}, server
+
+            return {recipient: (f"refused: {refused[recipient][0]} {_decode(refused[recipient][1])}" if recipient in refused else "delivered")
+                    for recipient in recipients}, server
+
+    def send(self, msg: MIMEText, recipients: list[str]) -> dict[str, str]:
+        """Send one message on a pooled connection; return the status per recipient."""
+        statuses, server = self._send_on(None, msg, recipients)
+        if server is not None:
+            self.release(server)
+        return statuses
+
+    def send_many(self, messages: list[tuple[MIMEText, list[str]]]) -> list[dict[str, str]]:
+        """Send several messages over one connection, so the handshake is paid once for all of them."""
+        server, results = None, []
+        try:
+            for msg, recipients in messages:
+                statuses, server = self._send_on(server, msg, recipients)
+                results.append(statuses)
+        finally:
+            if server is not None:
+                self.release(server)
+        return results
+
+    def close(self) -> None:
+        with self._condition:
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+        for server, _ in idle:
+            self._close(server)
+
+def _decode(value) -> str:
+    return value.decode("utf-8", "replace") if isinstance(value, bytes) else str(value)
+
+def _recipients(to_emails) -> list[str]:
+    if to_emails is None:
+        to_emails = [email for email in (os.getenv("GMAIL_TO"), SMTP_USER) if email]
+    elif isinstance(to_emails, str):
+        to_emails = [to_emails]
+    # GMAIL_TO and tool arguments may hold comma-separated lists
+    return list(dict.fromkeys(email.strip() for value in to_emails if value for email in str(value).split(",") if email.strip()))
+
+def _build_message(body: str, subject: str, recipients: list[str]) -> MIMEText:
+    msg = MIMEText(body or "", 'html')
+    msg['Subject'] = subject or "Sales email list test 1"
+    msg['From'] = SMTP_USER or ""
+    msg['To'] = ",".join(recipients)
+    return msg
+
+def _summary(statuses: dict[str, str]) -> str:
+    delivered = sum(status == "delivered" for status in statuses.values())
+    if delivered == len(statuses):
+        return "success"
+    return "partial" if delivered else "failure"
+
+smtp_pool = SMTPConnectionPool()
+
 # Create FastMCP server
 mcp = FastMCP(name="Email_Management_Server")
 
@@ -26,45 +200,51 @@ def get_app_version() -> dict:
     }
 
 @mcp.tool()
-def email_sender(body: str=None, subject: str=None, to_emails:list=None):
+async def email_sender(body: str=None, subject: str=None, to_emails:list=None):
     """ Send out an email with the given body to all sales prospects via Gmail SMTP """
-    
-    # Set up email sender, recipient, and content
-    from_email = os.getenv("GMAIL_USER")  # Replace with your Gmail address or set as env var
-    to_email = os.getenv("GMAIL_TO")     # Replace with recipient or set as env var
-    gmail_app_password = os.getenv("GMAIL_APP_PASSWORD")  # Use your Gmail app password or set as env var
-    
-    # Create the email
-    msg = MIMEText(body, 'html')
-    msg['Subject'] = subject
-    msg['From'] = from_email
-    to_email = None
-    
-    if to_emails is None:
-        to_emails = [from_email, to_email]
-    
-    if subject is None:
-        msg['Subject'] = "Sales email list test 1"
-    
-    for index, email in enumerate(to_emails):
-        if index !=0:
-            to_email += "," + email
-        else:
-            to_email = email
-            
-    if to_email is not None:
-        msg['To'] = to_email
-    
+    recipients = _recipients(to_emails)
+    if not recipients:
+        return {"status": "failure", "message": "no recipients"}
+
+    msg = _build_message(body, subject, recipients)
     try:
-        with smtplib.SMTP('smtp.gmail.com', 587) as server:
-            if to_email:
-                server.starttls()  # Secure the connection
-                server.login(from_email, gmail_app_password)
-                server.send_message(msg)
-            
-        return {"status": "success"}
+        # Off the event loop: the MCP server keeps answering while SMTP talks
+        statuses = await asyncio.to_thread(smtp_pool.send, msg, recipients)
     except Exception as e:
         return {"status": "failure", "message": str(e)}
+    return {"status": _summary(statuses), "recipients": statuses}
+
+@mcp.tool()
+async def email_batch_sender(messages: list[dict]):
+    """ Send many emails at once. Each message is {"body": ..., "subject": ..., "to_emails": [...]}.
+    Returns the delivery status of every recipient of every message. """
+    queued = []
+    results: list[dict] = [{} for _ in messages]
+    for index, message in enumerate(messages):
+        recipients = _recipients(message.get("to_emails"))
+        if not recipients:
+            results[index] = {"status": "failure", "message": "no recipients"}
+            continue
+        queued.append((index, _build_message(message.get("body"), message.get("subject"), recipients), recipients))
+
+    # One chunk per pooled connection; each chunk reuses its connection for all its messages
+    chunks = [queued[start::smtp_pool.size] for start in range(smtp_pool.size)]
+    outcomes = await asyncio.gather(*(asyncio.to_thread(smtp_pool.send_many, [(msg, recipients) for _, msg, recipients in chunk])
+                                      for chunk in chunks if chunk), return_exceptions=True)
+
+    for chunk, outcome in zip([chunk for chunk in chunks if chunk], outcomes):
+        for position, (index, _, recipients) in enumerate(chunk):
+            if isinstance(outcome, BaseException):
+                results[index] = {"status": "failure", "message": str(outcome)}
+            else:
+                results[index] = {"status": _summary(outcome[position]), "recipients": outcome[position]}
+
+    statuses = [result["status"] for result in results]
+    overall = "success" if all(status == "success" for status in statuses) else ("failure" if all(status == "failure" for status in statuses) else "partial")
+    return {"status": overall, "sent": statuses.count("success"), "messages": results}
 
 if __name__ == "__main__":
-    mcp.run(transport='stdio')
\ No newline at end of file
+    try:
+        mcp.run(transport='stdio')
+    finally:
+        smtp_pool.close()
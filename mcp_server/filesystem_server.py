@@ -1,9 +1,20 @@
 import os
+import csv
+import sys
 import json
+import mmap
+import time
+import sqlite3
+import hashlib
+import threading
+import codecs
 import base64
+import fnmatch
+import itertools
 import qrcode
 import requests
 import mimetypes
+from collections import OrderedDict
 from PIL import Image
 from io import BytesIO
 from datetime import datetime
@@ -13,6 +24,225 @@ from qrcode.image.styledpil import StyledPilImage
 
 load_dotenv(override=True)
 
+# Largest text payload a single read returns; ask for the next offset/line range to continue
+MAX_READ_BYTES = int(os.getenv("FS_MAX_READ_BYTES", str(256 * 1024)))
+# Files at least this big are memory-mapped instead of read, so a slice never loads the whole file
+MMAP_THRESHOLD_BYTES = int(os.getenv("FS_MMAP_THRESHOLD_BYTES", str(1024 * 1024)))
+LIST_PAGE_SIZE = int(os.getenv("FS_LIST_PAGE_SIZE", "100"))
+
+# Embedded SQLite copy of the sales CSV for the sql_query tool
+SALES_CSV_PATH = os.getenv("SALES_CSV_PATH", os.path.join(os.getcwd(), "dataset", "coffee_sales.csv"))
+SALES_DB_PATH = os.getenv("SALES_DB_PATH", os.path.join(os.getcwd(), ".cache", "sales.sqlite"))
+SQL_MAX_ROWS = int(os.getenv("SQL_MAX_ROWS", "1000"))
+SQL_TIMEOUT_SECONDS = float(os.getenv("SQL_TIMEOUT_SECONDS", "10"))
+SQL_CACHE_SIZE = int(os.getenv("SQL_CACHE_SIZE", "256"))
+# Bump when the table layout changes so existing databases are rebuilt
+SALES_DB_VERSION = 1
+
+def _decode(data: bytes, at_start: bool, at_end: bool) -> str:
+    """Decode a UTF-8 slice without garbling characters cut at its edges."""
+    if not at_start:
+        # Skip continuation bytes of a character that started before the slice
+        skip = 0
+        while skip < min(len(data), 3) and 0x80 <= data[skip] <= 0xBF:
+            skip += 1
+        data = data[skip:]
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    return decoder.decode(data, final=at_end)
+
+def _read_bytes(path: str, offset: int, length: int) -> tuple[bytes, int]:
+    """Return (bytes[offset:offset+length], file size), memory-mapping big files."""
+    size = os.path.getsize(path)
+    offset = min(max(offset, 0), size)
+    length = min(length, size - offset)
+    if length <= 0:
+        return b"", size
+    with open(path, "rb") as f:
+        if size >= MMAP_THRESHOLD_BYTES:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return mm[offset:offset + length], size
+        f.seek(offset)
+        return f.read(length), size
+
+def _read_lines(path: str, start_line: int, end_line: int | None) -> tuple[str, bool]:
+    """Stream lines start_line..end_line (1-based, inclusive) up to MAX_READ_BYTES; return (text, truncated)."""
+    chunks, used = [], 0
+    with open(path, "rb") as f:
+        for line in itertools.islice(f, max(start_line, 1) - 1, end_line):
+            if used + len(line) > MAX_READ_BYTES:
+                return _decode(b"".join(chunks), True, True), True
+            chunks.append(line)
+            used += len(line)
+    return _decode(b"".join(chunks), True, True), False
+
+def _tail_lines(path: str, count: int) -> tuple[list[str], int]:
+    """Last count lines of a file without reading it from the start; also returns their byte offset."""
+    size = os.path.getsize(path)
+    if size == 0 or count <= 0:
+        return [], size
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        # A trailing newline ends the last line rather than starting an empty one
+        end = size - 1 if mm[size - 1:size] == b"\n" else size
+        start = end
+        for _ in range(count):
+            start = mm.rfind(b"\n", 0, start)
+            if start < 0:
+                break
+        start = start + 1
+        return _decode(mm[start:end], True, True).splitlines(), start
+
+# Read-only: anything but reading tables and calling functions is refused
+_SQL_ALLOWED_ACTIONS = {sqlite3.SQLITE_SELECT, sqlite3.SQLITE_READ, sqlite3.SQLITE_FUNCTION, sqlite3.SQLITE_RECURSIVE}
+
+def _sql_authorizer(action, *args):
+    return sqlite3.SQLITE_OK if action in _SQL_ALLOWED_ACTIONS else sqlite3.SQLITE_DENY
+
+class SalesDatabase:
+    """SQLite copy of the sales CSV that agents query instead of scanning df with generated pandas code.
+
+    The 'sales' table holds the CSV columns plus year/quarter/month derived from 'date', with
+    indexes on date and coffee_name. It is rebuilt when the CSV's size or mtime changes. Queries
+    run read-only under a time limit, and their results are cached until the source changes.
+    """
+
+    def __init__(self, csv_path: str = SALES_CSV_PATH, db_path: str = SALES_DB_PATH, cache_size: int = SQL_CACHE_SIZE):
+        self.csv_path = csv_path
+        self.db_path = db_path
+        self.cache_size = cache_size
+        self._conn = None
+        self._source = None
+        self._cache: OrderedDict[str, dict] = OrderedDict()
+        # One connection serves every tool call; sqlite3 connections are not safe to share concurrently
+        self._lock = threading.Lock()
+
+    def _source_key(self) -> str:
+        stat = os.stat(self.csv_path)
+        return f"{os.path.abspath(self.csv_path)}:{stat.st_size}:{stat.st_mtime_ns}:v{SALES_DB_VERSION}"
+
+    def _built_from(self) -> str | None:
+        try:
+            conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+            try:
+                return conn.execute("SELECT value FROM meta WHERE key = 'source'").fetchone()[0]
+            finally:
+                conn.close()
+        except (sqlite3.Error, TypeError):
+            return None
+
+    def _build(self, source: str) -> None:
+        """Load the CSV into a fresh database file in batches, then index it and swap it in."""
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        tmp_path = f"{self.db_path}.{os.getpid()}.tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        start = time.perf_counter()
+        conn = sqlite3.connect(tmp_path)
+        try:
+            with open(self.csv_path, newline="", encoding="utf-8") as file:
+                reader = csv.reader(file)
+                header = next(reader)
+                sample = list(itertools.islice(reader, 1000))
+                quoted = ['"' + name.replace('"', '""') + '"' for name in header]
+                columns = [f"{name} {_sql_type([row[index] for row in sample if index < len(row)])}" for index, name in enumerate(quoted)]
+                derived = ["year INTEGER", "quarter INTEGER", "month INTEGER"] if "date" in header else []
+                conn.execute(f"CREATE TABLE sales ({', '.join(columns + derived)})")
+
+                insert = f"INSERT INTO sales ({', '.join(quoted)}) VALUES ({', '.join('?' * len(header))})"
+                rows = itertools.chain(sample, reader)
+                while batch := [[value if value != "" else None for value in row] for row in itertools.islice(rows, 50_000)]:
+                    conn.executemany(insert, batch)
+
+            if derived:
+                # ISO dates, so SQLite's own date functions derive the parts in one pass
+                conn.execute("UPDATE sales SET year = CAST(strftime('%Y', date) AS INTEGER), month = CAST(strftime('%m', date) AS INTEGER)")
+                conn.execute("UPDATE sales SET quarter = (month + 2) / 3")
+            for column in ("date", "coffee_name"):
+                if column in header:
+                    conn.execute(f'CREATE INDEX idx_sales_{column} ON sales ("{column}")')
+            conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+            conn.execute("INSERT INTO meta VALUES ('source', ?)", (source,))
+            conn.commit()
+            rows_loaded = conn.execute("SELECT count(*) FROM sales").fetchone()[0]
+        finally:
+            conn.close()
+        os.replace(tmp_path, self.db_path)
+        # stdout carries the stdio JSON-RPC stream
+        print(f"Built {self.db_path} from {os.path.basename(self.csv_path)}: {rows_loaded} rows in {time.perf_counter() - start:.2f}s",
+              file=sys.stderr)
+
+    def _connection(self) -> sqlite3.Connection:
+        """Read-only connection to a database that matches the current CSV; call with the lock held."""
+        source = self._source_key()
+        if self._conn is not None and source == self._source:
+            return self._conn
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        if self._built_from() != source:
+            self._build(source)
+        conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False)
+        conn.execute("PRAGMA query_only = ON")
+        conn.set_authorizer(_sql_authorizer)
+        self._conn, self._source = conn, source
+        self._cache.clear()
+        return conn
+
+    def query(self, sql: str, params: list | None = None, max_rows: int = SQL_MAX_ROWS) -> dict:
+        """Run one read-only statement; return its columns and at most max_rows rows."""
+        with self._lock:
+            conn = self._connection()
+            key = hashlib.sha256(json.dumps([self._source, " ".join(sql.split()), params, max_rows]).encode("utf-8")).hexdigest()
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return {**self._cache[key], "cached": True}
+
+            deadline = time.monotonic() + SQL_TIMEOUT_SECONDS
+            # Returning True interrupts the statement
+            conn.set_progress_handler(lambda: time.monotonic() > deadline, 10_000)
+            start = time.perf_counter()
+            try:
+                cursor = conn.execute(sql, params or [])
+                rows = cursor.fetchmany(max_rows + 1)
+            finally:
+                conn.set_progress_handler(None, 0)
+            result = {"columns": [column[0] for column in cursor.description or []],
+                      "rows": [list(row) for row in rows[:max_rows]],
+                      "row_count": min(len(rows), max_rows),
+                      "truncated": len(rows) > max_rows,
+                      "elapsed_ms": round((time.perf_counter() - start) * 1000, 3)}
+            self._cache[key] = result
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            return {**result, "cached": False}
+
+    def schema(self) -> dict:
+        with self._lock:
+            conn = self._connection()
+            # pragma_table_info is fixed SQL, not a user query, but the authorizer refuses pragmas
+            conn.set_authorizer(None)
+            try:
+                columns = conn.execute("SELECT name, type FROM pragma_table_info('sales')").fetchall()
+            finally:
+                conn.set_authorizer(_sql_authorizer)
+            rows = conn.execute("SELECT count(*) FROM sales").fetchone()[0]
+            indexes = [name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'sales'")]
+        return {"table": "sales", "rows": rows, "columns": [{"name": name, "type": type_} for name, type_ in columns],
+                "indexes": indexes, "source": self.csv_path}
+
+def _sql_type(values: list[str]) -> str:
+    """Column type from a sample of CSV values: INTEGER, REAL or TEXT."""
+    values = [value for value in values if value != ""]
+    for sql_type, parse in (("INTEGER", int), ("REAL", float)):
+        try:
+            for value in values:
+                parse(value)
+        except ValueError:
+            continue
+        return sql_type if values else "TEXT"
+    return "TEXT"
+
+sales_db = SalesDatabase()
+
 mcp = FastMCP(name="filesystem-mcp-server")
 
 @mcp.resource("config://app-version")
@@ -26,25 +256,114 @@ def get_app_version() -> dict:
     }
     
 @mcp.tool()
-def read_file(path: str) -> str:
-    """Read contents of a file.
-    
+def read_file(path: str, offset: int = 0, length: int = None, start_line: int = None, end_line: int = None) -> str:
+    """Read contents of a file, or a byte or line range of it.
+
+    At most FS_MAX_READ_BYTES are returned per call; a trailing note gives the offset to continue from.
+
     Args:
         path: Path to the file to read
+        offset: Byte offset to start reading at
+        length: Number of bytes to read (defaults to the rest of the file)
+        start_line: First line to return (1-based); switches to a line range read
+        end_line: Last line to return (inclusive, defaults to the end of the file)
     """
     try:
-        with open(path, 'r', encoding='utf-8') as f:
-            return f.read()
+        if start_line is not None or end_line is not None:
+            text, truncated = _read_lines(path, start_line or 1, end_line)
+            if truncated:
+                text += f"\n... [truncated at {MAX_READ_BYTES} bytes; read fewer lines per call]"
+            return text
+
+        wanted = MAX_READ_BYTES if length is None else min(length, MAX_READ_BYTES)
+        data, size = _read_bytes(path, offset, wanted)
+        offset = min(max(offset, 0), size)
+        end = offset + len(data)
+        text = _decode(data, offset == 0, end == size)
+        requested_end = size if length is None else min(size, offset + length)
+        if end < requested_end:
+            text += f"\n... [truncated: bytes {offset}-{end} of {size}; continue with offset={end}]"
+        return text
     except Exception as e:
         return f"Error reading file: {str(e)}"
 
 @mcp.tool()
-def encode_image_b64(path: str) -> tuple[str, str]:
-    """Return (media_type, base64_str) for an image file path."""
+def sample_file(path: str, head: int = 10, tail: int = 10) -> str:
+    """Return the first and last lines of a file, e.g. a CSV header and its latest rows.
+
+    Args:
+        path: Path to the file to sample
+        head: Number of lines from the start
+        tail: Number of lines from the end
+    """
+    try:
+        size = os.path.getsize(path)
+        with open(path, "rb") as f:
+            head_lines = [_decode(line, True, True).rstrip("\r\n") for line in itertools.islice(f, max(head, 0))]
+            head_end = f.tell()
+        tail_lines, tail_start = _tail_lines(path, tail)
+        if tail_start < head_end:
+            # Small file: the tail overlaps the head, so show only the lines after the head
+            rest, _ = _read_bytes(path, head_end, size - head_end)
+            tail_lines = _decode(rest, True, True).splitlines()[-max(tail, 0):] if tail > 0 else []
+            return "\n".join(head_lines + tail_lines)
+        omitted = tail_start - head_end
+        separator = [f"... [{omitted} bytes omitted of {size}] ..."] if omitted else []
+        return "\n".join(head_lines + separator + tail_lines)
+    except Exception as e:
+        return f"Error sampling file: {str(e)}"
+
+@mcp.tool()
+def sql_schema() -> str:
+    """Describe the 'sales' table behind sql_query: columns, types, row count and indexes."""
+    try:
+        return json.dumps(sales_db.schema(), indent=2)
+    except Exception as e:
+        return f"Error reading schema: {str(e)}"
+
+@mcp.tool()
+def sql_query(sql: str, max_rows: int = 200) -> str:
+    """Run a read-only SQL query (SQLite dialect) over the coffee sales data and return the result as JSON.
+
+    Push filtering and aggregation into the query (WHERE, GROUP BY, SUM, COUNT) so only the small
+    result needed for a chart comes back. The 'sales' table has the CSV columns (date as
+    'YYYY-MM-DD', time, cash_type, card, price, coffee_name) plus year, quarter and month; date
+    and coffee_name are indexed. Example:
+    SELECT year, month, SUM(price) AS sales FROM sales WHERE quarter = 1 GROUP BY year, month ORDER BY year, month
+
+    Args:
+        sql: One SELECT (or WITH ... SELECT) statement
+        max_rows: Maximum number of rows to return
+    """
+    try:
+        return json.dumps(sales_db.query(sql, max_rows=max(1, min(max_rows, SQL_MAX_ROWS))))
+    except Exception as e:
+        return f"Error running query: {str(e)}"
+
+@mcp.tool()
+def encode_image_b64(path: str, max_pixels: int = None) -> tuple[str, str]:
+    """Return (media_type, base64_str) for an image file path.
+
+    Args:
+        path: Path to the image
+        max_pixels: Downscale (and recompress as JPEG) to at most this many pixels first
+    """
     mime, _ = mimetypes.guess_type(path)
     media_type = mime or "image/png"
-    with open(path, "rb") as f:
-        b64 = base64.b64encode(f.read()).decode("utf-8")
+    source = open(path, "rb")
+    if max_pixels:
+        with Image.open(path) as img:
+            if img.width * img.height > max_pixels:
+                scale = (max_pixels / (img.width * img.height)) ** 0.5
+                thumb = img.convert("RGB").resize((max(1, int(img.width * scale)), max(1, int(img.height * scale))), Image.LANCZOS, reducing_gap=3.0)
+                source.close()
+                source = BytesIO()
+                thumb.save(source, format="JPEG", quality=85, optimize=True)
+                source.seek(0)
+                media_type = "image/jpeg"
+    # Encode in 3-byte aligned chunks instead of one read of the whole file
+    with source:
+        b64 = "".join(base64.b64encode(chunk).decode("ascii") for chunk in iter(lambda: source.read(3 * 64 * 1024), b""))
     return media_type, b64
 
 @mcp.tool()
@@ -80,15 +399,30 @@ def write_file(path: str, content: str) -> str:
         return f"Error writing file: {str(e)}"
 
 @mcp.tool()
-def list_directory(path: str = ".") -> str:
-    """List contents of a directory.
-    
+def list_directory(path: str = ".", pattern: str = None, offset: int = 0, limit: int = LIST_PAGE_SIZE) -> str:
+    """List contents of a directory one page at a time, with type, size and modification time.
+
     Args:
         path: Path to the directory (defaults to current directory)
+        pattern: Glob to filter names, e.g. '*.png'
+        offset: Index of the first entry to return
+        limit: Maximum number of entries to return
     """
     try:
-        items = os.listdir(path)
-        return json.dumps(items, indent=2)
+        with os.scandir(path) as it:
+            entries = sorted((entry for entry in it if pattern is None or fnmatch.fnmatch(entry.name, pattern)),
+                             key=lambda entry: entry.name)
+        offset = max(offset, 0)
+        page = []
+        # Only the returned page is stat'ed
+        for entry in entries[offset:offset + limit]:
+            stat = entry.stat()
+            page.append({"name": entry.name,
+                         "type": "directory" if entry.is_dir() else "file",
+                         "size": stat.st_size,
+                         "modified": datetime.fromtimestamp(stat.st_mtime).isoformat(timespec="seconds")})
+        next_offset = offset + len(page) if offset + len(page) < len(entries) else None
+        return json.dumps({"path": path, "total": len(entries), "offset": offset, "next_offset": next_offset, "entries": page}, indent=2)
     except Exception as e:
         return f"Error listing directory: {str(e)}"
 
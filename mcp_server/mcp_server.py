@@ -1,11 +1,12 @@
 import os
 import json
+import time
+import asyncio
 from dotenv import load_dotenv
 from agents.mcp import MCPServerStdio
 from contextlib import AsyncExitStack
 from typing import List, Dict, TypedDict
-from mcp.client.stdio import stdio_client
-from mcp import ClientSession, StdioServerParameters
+from mcp import ClientSession
 
 load_dotenv(override=True)
 
@@ -13,74 +14,160 @@ class ToolDefinition(TypedDict):
     name: str
     description: str
     input_schema: dict
-    
+
 class Agentic_MCP_Server:
-    
-    def __init__(self):
+
+    def __init__(self, lazy: bool=False):
         # Initialize session and client objects
         self.sessions: List[ClientSession] = [] # new
-        self.exit_stack = AsyncExitStack() # new
-        
+
         self.available_tools: List[ToolDefinition] = [] # new
         self.tool_to_session: Dict[str, ClientSession] = {} # new
-        
+
         self.mcp_servers: Dict[str, list[MCPServerStdio]] = {} # new
-        
+
         self.available_resource: List[ToolDefinition] = [] # new
         self.resource_to_session: Dict[str, ClientSession] = {} # new
-        
+
+        # Lazy mode only spawns a server the first time a tool or agent asks for it
+        self.lazy = lazy
+        self.server_configs: Dict[str, dict] = {}
+        self.startup_timings: Dict[str, float] = {}
+        self._server_tasks: Dict[str, asyncio.Task] = {}
+        self._server_ready: Dict[str, asyncio.Future] = {}
+        self._server_stop: Dict[str, asyncio.Event] = {}
+
+    async def _serve(self, server_name: str, server_config: dict, ready: asyncio.Future, stop: asyncio.Event) -> None:
+        """Own one server's transports for its whole lifetime.
+
+        The stdio transports use anyio cancel scopes, which must be exited by the task that entered
+        them, so each server gets its own task and exit stack instead of sharing one.
+        """
+        start = time.perf_counter()
+        async with AsyncExitStack() as exit_stack:
+            try:
+                # One subprocess per server: the agents SDK wrapper owns the transport and its
+                # ClientSession is reused for the raw call_tool/read_resource paths.
+                # cache_tools_list keeps agents from re-querying list_tools on every run.
+                mcp_server = await exit_stack.enter_async_context(
+                    MCPServerStdio(server_config, cache_tools_list=True, name=server_name, client_session_timeout_seconds=360))
+                self.mcp_servers[server_name] = [mcp_server]
+
+                client_session = mcp_server.session
+                self.sessions.append(client_session)
+
+                tools = await mcp_server.list_tools()
+                self.startup_timings[server_name] = time.perf_counter() - start
+                print(f"\nConnected to {server_name} in {self.startup_timings[server_name]:.2f}s with tools:", [t.name for t in tools])
+
+                for tool in tools:
+                    self.tool_to_session[tool.name]=client_session
+                    self.available_tools.append(tool)
+
+                capabilities = mcp_server.server_initialize_result.capabilities
+                if capabilities.resources is not None:
+                    response = await client_session.list_resources()
+                    for resource in response.resources:
+                        self.resource_to_session[str(resource.uri)]=client_session
+                        self.available_resource.append(resource)
+
+            except Exception as e:
+                ready.set_exception(e)
+                return
+
+            ready.set_result(True)
+            await stop.wait()
+
     async def connect_to_server(self, server_name: str, server_config: dict) -> None:
-        """Connect to a single MCP server."""
+        """Connect to a single MCP server, or wait for a connection already in progress.
+
+        Raises when the server fails to start; the failed attempt is forgotten so the next call retries.
+        """
+        if server_name not in self._server_tasks:
+            self._server_ready[server_name] = asyncio.get_running_loop().create_future()
+            self._server_stop[server_name] = asyncio.Event()
+            self._server_tasks[server_name] = asyncio.create_task(
+                self._serve(server_name, server_config, self._server_ready[server_name], self._server_stop[server_name]))
+        ready = self._server_ready[server_name]
         try:
-            server_params = StdioServerParameters(**server_config)
-            stdio_transport = await self.exit_stack.enter_async_context(stdio_client(server_params))
-            
-            read, write = stdio_transport
-            client_session = await self.exit_stack.enter_async_context(ClientSession(read, write))
-            
-            # Instead of using MCP tools directly we should give mcp_server function definitions for OpenAI support
-            self.mcp_servers[server_name] = [await self.exit_stack.enter_async_context(MCPServerStdio(server_config, client_session_timeout_seconds=360))]
-            
-            await client_session.initialize()
-            self.sessions.append(client_session)
-            
-            response = await client_session.list_tools()
-            tools = response.tools
-            print(f"\nConnected to {server_name} with tools:", [t.name for t in tools])
-            
-            for tool in tools:
-                self.tool_to_session[tool.name]=client_session
-                self.available_tools.append(tool)
-            
+            await asyncio.shield(ready)
         except Exception as e:
             print(f"Failed to connect to server {server_name}: {e}")
-    
+            # Another caller may already have dropped this attempt and started a new one
+            if self._server_ready.get(server_name) is ready:
+                self._server_ready.pop(server_name)
+                self._server_stop.pop(server_name)
+                self._server_tasks.pop(server_name)
+                self.mcp_servers.pop(server_name, None)
+            raise
+
     async def connect_to_servers(self): # new
-        """Connect to all configured MCP servers."""
+        """Connect to all configured MCP servers concurrently (or just load the config in lazy mode)."""
         try:
             with open(os.path.join(os.getcwd(), "mcp_config", "server_config.json"), "r") as file:
                 data = json.load(file)
-            
-            servers = data.get("mcpServers", {})
-            
-            for server_name, server_config in servers.items():
-                await self.connect_to_server(server_name, server_config)
-                
+
+            self.server_configs = data.get("mcpServers", {})
+
+            if not self.lazy:
+                # A server that fails to start is reported and retried on first use; the others stay up
+                await asyncio.gather(*(self.connect_to_server(server_name, server_config)
+                                       for server_name, server_config in self.server_configs.items()),
+                                     return_exceptions=True)
+                self.print_startup_timings()
+
         except Exception as e:
             print(f"Error loading server configuration: {e}")
             raise
-    
-    async def cleanup(self): 
-        """Cleanly close all resources using AsyncExitStack."""
-        await self.exit_stack.aclose()
-    
+
+    async def ensure_server(self, server_name: str) -> None:
+        """Start a configured server if it is not running yet."""
+        await self.connect_to_server(server_name, self.server_configs[server_name])
+
+    async def get_mcp_servers(self, server_name: str) -> list[MCPServerStdio]:
+        """Return the agents SDK server objects for Agent(mcp_servers=...), starting the server if needed.
+
+        Raises when the server cannot be started, so an agent never runs without its tools.
+        """
+        await self.ensure_server(server_name)
+        return self.mcp_servers[server_name]
+
+    def print_startup_timings(self) -> None:
+        for server_name, seconds in sorted(self.startup_timings.items(), key=lambda item: -item[1]):
+            print(f"  {server_name:<24} {seconds * 1000:8.0f} ms")
+
+    async def cleanup(self):
+        """Stop every started server and wait for its transports to close."""
+        for stop in self._server_stop.values():
+            stop.set()
+        results = await asyncio.gather(*self._server_tasks.values(), return_exceptions=True)
+        for server_name, result in zip(self._server_tasks, results):
+            if isinstance(result, BaseException):
+                print(f"Error closing server {server_name}: {result}")
+        self._server_tasks.clear()
+        self._server_ready.clear()
+        self._server_stop.clear()
+
     async def call_tool(self, tool_name:str, tool_args:dict):
+        # In lazy mode the tool owner is unknown until its server lists its tools, so start the rest
+        if tool_name not in self.tool_to_session:
+            await asyncio.gather(*(self.ensure_server(server_name) for server_name in self.server_configs), return_exceptions=True)
+
+        if tool_name not in self.tool_to_session:
+            raise KeyError(f"No running MCP server provides the tool {tool_name!r}")
+
         # Call a tool
-        session = self.tool_to_session[tool_name] 
+        session = self.tool_to_session[tool_name]
         tool_result = await session.call_tool(tool_name, arguments=tool_args)
         return tool_result
 
     async def read_resource(self,resource_name):
+        if resource_name not in self.resource_to_session:
+            await asyncio.gather(*(self.ensure_server(server_name) for server_name in self.server_configs), return_exceptions=True)
+
+        if resource_name not in self.resource_to_session:
+            raise KeyError(f"No running MCP server provides the resource {resource_name!r}")
+
         session = self.resource_to_session[resource_name]
         resource_result = await session.read_resource(resource_name)
-        return resource_result
\ No newline at end of file
+        return resource_result
@@ -1,3 +1,4 @@
+import os
 from enum import StrEnum
 class ApiConfig(StrEnum):
     
@@ -8,7 +9,8 @@ class ApiConfig(StrEnum):
     GROK_BASE_URL = "https://api.x.ai/v1"
     GROQ_BASE_URL = "https://api.groq.com/openai/v1"
     OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
-    OLLAMA_BASE_URL = "http://127.0.0.1:11434/v1"
+    # Overridable so benchmarks and remote hosts can point the local clients elsewhere
+    OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://127.0.0.1:11434/v1")
     
     # Model name
     DEEP_SEEK_MODEL = "deepseek-chat"
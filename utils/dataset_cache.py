@@ -0,0 +1,485 @@
+import os
+import json
+import hashlib
+
+import pandas as pd
+from dotenv import load_dotenv
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:  # the columnar cache is optional, fall back to parsing the CSV every time
+    pa = pc = None
+    print("Warning: pyarrow is not installed, so the prepared-frame cache is off and the CSV is parsed on every load.")
+
+from utils.utils import profile_frame, merge_profiles
+
+load_dotenv(override=True)
+
+# Bump when the preparation steps change so stale caches are rebuilt
+CACHE_VERSION = 3
+DATE_FORMAT = "%Y-%m-%d"
+TIME_FORMAT = "%H:%M"
+# Precision 'price' is stored at. float32 halves the column but plain df['price'].sum() then drifts;
+# cube sums are always accumulated in float64 from prices rounded to PRICE_DECIMALS
+PRICE_DTYPE = os.getenv("PRICE_DTYPE", "float64")
+PRICE_DECIMALS = int(os.getenv("PRICE_DECIMALS", "4"))
+# Object columns with at most this share of distinct values, and no more than CATEGORY_MAX_DISTINCT,
+# become categoricals. The cap keeps ids and clock times plain: groupby on categoricals defaults to
+# observed=False, which returns the cartesian product of every category
+CATEGORY_RATIO = 0.5
+CATEGORY_MAX_DISTINCT = int(os.getenv("CATEGORY_MAX_DISTINCT", "64"))
+CALENDAR_DTYPES = {"quarter": "int8", "month": "int8", "year": "int16"}
+# Dimensions almost every chart query groups by; the cube sums price and counts rows over them
+CUBE_DIMENSIONS = ["year", "quarter", "month", "coffee_name", "cash_type"]
+# Frame mode holds the whole prepared frame in memory; larger sources should use ingest_mode="cube"
+FRAME_MEMORY_BUDGET_MB = float(os.getenv("FRAME_MEMORY_BUDGET_MB", "2048"))
+DATASET_CACHE_DIR = os.getenv("DATASET_CACHE_DIR", os.path.join(os.getcwd(), ".cache", "datasets"))
+
+# === Preparation ===
+def _parse_datetimes(raw: pd.Series, fmt: str) -> pd.Series:
+    parsed = pd.to_datetime(raw, format=fmt, errors="coerce")
+    # Not the expected layout, let pandas infer it instead of losing every row to NaT
+    if parsed.isna().all() and raw.notna().any():
+        parsed = pd.to_datetime(raw, errors="coerce")
+    return parsed
+
+def derive_date_parts(df: pd.DataFrame) -> pd.DataFrame:
+    """Parse 'date' and derive quarter/month/year used by the charts, plus a 'timestamp' from date + time."""
+    if "date" in df.columns:
+        df["date"] = _parse_datetimes(df["date"], DATE_FORMAT)
+        if "time" in df.columns:
+            clock = _parse_datetimes(df["time"], TIME_FORMAT)
+            df["timestamp"] = df["date"] + (clock - clock.dt.normalize())
+        df["quarter"] = df["date"].dt.quarter
+        df["month"] = df["date"].dt.month
+        df["year"] = df["date"].dt.year
+    return df
+
+def _category_limit(rows: int) -> float:
+    return min(CATEGORY_RATIO * rows, CATEGORY_MAX_DISTINCT)
+
+def optimize_dtypes(df: pd.DataFrame, price_dtype: str=PRICE_DTYPE, categoricals: bool=True) -> pd.DataFrame:
+    """Shrink the prepared frame: int8/int16 calendar parts, price at price_dtype, low-cardinality strings as categoricals."""
+    for column, dtype in CALENDAR_DTYPES.items():
+        if column in df.columns:
+            # Unparseable dates leave gaps, which plain numpy ints cannot hold
+            df[column] = df[column].astype(dtype.capitalize() if df[column].isna().any() else dtype)
+    if "price" in df.columns and price_dtype:
+        df["price"] = pd.to_numeric(df["price"], errors="coerce").astype(price_dtype)
+    if categoricals:
+        for column in df.select_dtypes(include="object").columns:
+            if df[column].nunique(dropna=True) <= _category_limit(len(df)):
+                df[column] = df[column].astype("category")
+    return df
+
+def memory_footprint(df: pd.DataFrame) -> int:
+    """Bytes held by the frame, including the strings behind object columns."""
+    return int(df.memory_usage(deep=True, index=True).sum())
+
+def memory_report(before: int, after: int) -> str:
+    saved = 100 * (1 - after / before) if before else 0
+    return f"{before / 2**20:.2f} MB -> {after / 2**20:.2f} MB ({saved:.0f}% smaller)"
+
+def build_sales_cube(df: pd.DataFrame) -> pd.DataFrame | None:
+    """Materialize price sums and row counts per year/quarter/month/coffee_name/cash_type."""
+    dimensions = [column for column in CUBE_DIMENSIONS if column in df.columns]
+    if not dimensions or "price" not in df.columns:
+        return None
+    cube = (df.assign(price=df["price"].astype("float64").round(PRICE_DECIMALS))
+              .groupby(dimensions, observed=True, dropna=False)
+              .agg(price=("price", "sum"), count=("price", "size"))
+              .reset_index())
+    return optimize_dtypes(cube, price_dtype=None, categoricals=False)
+
+def make_cube_text(cube: pd.DataFrame) -> str:
+    """Describe the cube for the prompts."""
+    columns = "\n".join(f"    - {column}: {dtype}" for column, dtype in cube.dtypes.items())
+    return (f"A pre-aggregated DataFrame 'cube' is also available ({len(cube)} rows, one per "
+            f"{'/'.join(column for column in CUBE_DIMENSIONS if column in cube.columns)} combination):\n"
+            f"{columns}\n"
+            "    'price' is the sum of price and 'count' the number of sales in each group.\n"
+            "    Prefer 'cube' over 'df' for totals and counts by these columns; it is much smaller than df.")
+
+# === Fingerprints ===
+def hash_file(path: str, chunk_size: int=1 << 20) -> str:
+    """Return the sha256 of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        while chunk := file.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def file_fingerprint(path: str) -> dict:
+    """Return size, mtime and content hash identifying a source file."""
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": hash_file(path)}
+
+def _cache_paths(csv_path: str, cache_dir: str, kind: str="frame") -> tuple[str, str]:
+    abs_path = os.path.abspath(csv_path)
+    stem = os.path.splitext(os.path.basename(abs_path))[0]
+    key = hashlib.sha1(abs_path.encode("utf-8")).hexdigest()[:12]
+    base = os.path.join(cache_dir, f"{stem}-{key}" if kind == "frame" else f"{stem}-{key}-{kind}")
+    return f"{base}.arrow", f"{base}.json"
+
+def _read_meta(meta_path: str) -> dict | None:
+    try:
+        with open(meta_path, "r", encoding="utf-8") as file:
+            meta = json.load(file)
+    except (OSError, ValueError):
+        return None
+    return meta if meta.get("version") == CACHE_VERSION else None
+
+def _write_meta(meta_path: str, fingerprint: dict) -> None:
+    with open(meta_path, "w", encoding="utf-8") as file:
+        json.dump({"version": CACHE_VERSION, "fingerprint": fingerprint}, file)
+
+def cached_fingerprint(csv_path: str, cache_dir: str=DATASET_CACHE_DIR, kind: str="frame") -> dict | None:
+    """Return the fingerprint of the cached frame if it still matches the source file.
+
+    Size and mtime are checked first; the content hash is only recomputed when they changed,
+    so a touched but identical file keeps its cache.
+    """
+    arrow_path, meta_path = _cache_paths(csv_path, cache_dir, kind)
+    meta = _read_meta(meta_path)
+    if meta is None or not os.path.exists(arrow_path):
+        return None
+
+    cached = meta["fingerprint"]
+    stat = os.stat(csv_path)
+    if stat.st_size != cached["size"]:
+        return None
+    if stat.st_mtime_ns == cached["mtime_ns"]:
+        return cached
+
+    current = file_fingerprint(csv_path)
+    if current["sha256"] != cached["sha256"]:
+        return None
+    _write_meta(meta_path, current)
+    return current
+
+# === Loading ===
+def read_prepared_csv(csv_path: str) -> pd.DataFrame:
+    """Parse the CSV, derive the date parts and compact the dtypes, without touching the cache."""
+    df = derive_date_parts(pd.read_csv(csv_path))
+    before = memory_footprint(df)
+    df = optimize_dtypes(df)
+    print(f"Prepared {os.path.basename(csv_path)}: {memory_report(before, memory_footprint(df))}")
+    return df
+
+def iter_prepared_chunks(csv_path: str, chunksize: int):
+    """Yield prepared chunks of the CSV; peak memory follows the chunk size, not the file size.
+
+    Categoricals are left out: each chunk would get its own categories, which one Arrow file cannot
+    hold. _read_arrow dictionary-encodes those columns when the cache is loaded instead.
+    """
+    with pd.read_csv(csv_path, chunksize=chunksize) as reader:
+        for chunk in reader:
+            yield optimize_dtypes(derive_date_parts(chunk), categoricals=False)
+
+def _read_arrow(arrow_path: str) -> pd.DataFrame:
+    with pa.memory_map(arrow_path, "r") as source:
+        table = pa.ipc.open_file(source).read_all()
+    # Dictionary-encode in Arrow so low-cardinality strings never materialize as Python objects
+    for index, field in enumerate(table.schema):
+        if pa.types.is_string(field.type) or pa.types.is_large_string(field.type):
+            column = table.column(index)
+            if pc.count_distinct(column).as_py() <= _category_limit(len(table)):
+                table = table.set_column(index, field.name, pc.dictionary_encode(column))
+    # Copy on purpose: zero-copy columns would be read-only views of the map, and the generated code writes to df
+    return table.to_pandas()
+
+def _load_cached(csv_path: str, cache_dir: str, kind: str, build) -> pd.DataFrame:
+    """Return the cached Arrow table of this kind, rebuilding it with build(arrow_path) when stale.
+
+    build() returns the frame it wrote, or None when it streamed straight to disk, in which case
+    the file is memory-mapped back.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    arrow_path, meta_path = _cache_paths(csv_path, cache_dir, kind)
+
+    fingerprint = cached_fingerprint(csv_path, cache_dir, kind)
+    if fingerprint is not None:
+        df = _read_arrow(arrow_path)
+    else:
+        fingerprint = file_fingerprint(csv_path)
+        df = build(arrow_path)
+        _write_meta(meta_path, fingerprint)
+        if df is None:
+            df = _read_arrow(arrow_path)
+    df.attrs["fingerprint"] = fingerprint
+    return df
+
+def load_prepared_frame(csv_path: str, cache_dir: str=DATASET_CACHE_DIR, use_cache: bool=True, chunksize: int | None=None) -> pd.DataFrame:
+    """Load the prepared frame, from a memory-mapped Arrow IPC cache when it is still valid.
+
+    With chunksize the CSV is streamed into the cache chunk by chunk, so building it never holds
+    the whole parsed file in memory. The returned frame is still read back whole, so peak memory
+    follows the size of the data either way; only load_sales_cube handles sources larger than
+    memory. The source fingerprint is stored in df.attrs["fingerprint"].
+    """
+    if pa is None or not use_cache:
+        df = read_prepared_csv(csv_path)
+        df.attrs["fingerprint"] = file_fingerprint(csv_path)
+        return df
+
+    def build(arrow_path: str) -> pd.DataFrame | None:
+        if chunksize is None:
+            df = read_prepared_csv(csv_path)
+            write_arrow_cache(df, arrow_path)
+            return df
+        write_arrow_chunks(iter_prepared_chunks(csv_path, chunksize), arrow_path)
+        return None
+
+    return _load_cached(csv_path, cache_dir, "frame", build)
+
+def stream_sales_cube(csv_path: str, chunksize: int=1_000_000) -> pd.DataFrame:
+    """Build the sales cube by pre-reducing each chunk, without ever loading the full frame."""
+    cube = None
+    for chunk in iter_prepared_chunks(csv_path, chunksize):
+        partial = build_sales_cube(chunk)
+        if partial is None:
+            raise ValueError(f"{csv_path} has no 'price' or date columns to aggregate")
+        cube = partial if cube is None else _merge_cubes(cube, partial)
+    return cube
+
+def _merge_cubes(cube: pd.DataFrame, partial: pd.DataFrame) -> pd.DataFrame:
+    dimensions = [column for column in CUBE_DIMENSIONS if column in cube.columns]
+    return (pd.concat([cube, partial], ignore_index=True)
+              .groupby(dimensions, observed=True, dropna=False)[["price", "count"]].sum()
+              .reset_index())
+
+def load_sales_cube(csv_path: str, cache_dir: str=DATASET_CACHE_DIR, use_cache: bool=True, chunksize: int=1_000_000) -> pd.DataFrame:
+    """Load only the streamed sales cube, cached as Arrow next to the frame cache."""
+    if pa is None or not use_cache:
+        cube = stream_sales_cube(csv_path, chunksize)
+        cube.attrs["fingerprint"] = file_fingerprint(csv_path)
+        return cube
+
+    def build(arrow_path: str) -> pd.DataFrame:
+        cube = stream_sales_cube(csv_path, chunksize)
+        write_arrow_cache(cube, arrow_path)
+        return cube
+
+    return _load_cached(csv_path, cache_dir, "cube", build)
+
+def load_exec_frames(csv_path: str, sales_cube: bool=True, ingest_mode: str="frame", chunksize: int | None=None) -> dict:
+    """Return the frames handed to generated code.
+
+    ingest_mode 'frame' loads the whole prepared df into memory (chunksize only bounds the memory
+    used while building the cache) and optionally derives the cube from it. 'cube' only streams the
+    aggregates: df and cube are then the same pre-aggregated frame, for sources that do not fit in
+    memory. Frame mode warns when the source is larger than FRAME_MEMORY_BUDGET_MB.
+    """
+    if ingest_mode == "cube":
+        cube = load_sales_cube(csv_path, chunksize=chunksize or 1_000_000)
+        return {"df": cube, "cube": cube}
+
+    size_mb = os.path.getsize(csv_path) / 2**20
+    if size_mb > FRAME_MEMORY_BUDGET_MB:
+        print(f"Warning: {os.path.basename(csv_path)} is {size_mb:.0f} MB, over the {FRAME_MEMORY_BUDGET_MB:.0f} MB frame budget; "
+              f"frame mode loads it whole, use ingest_mode='cube' for sources larger than memory")
+
+    df = load_prepared_frame(csv_path, chunksize=chunksize)
+    frames = {"df": df}
+    if sales_cube:
+        cube = build_sales_cube(df)
+        if cube is not None:
+            frames["cube"] = cube
+    return frames
+
+def write_arrow_cache(df: pd.DataFrame, arrow_path: str) -> None:
+    """Write the frame as an uncompressed Arrow IPC file so later loads can memory-map it."""
+    write_arrow_chunks([df], arrow_path)
+
+def write_arrow_chunks(chunks, arrow_path: str) -> None:
+    """Append frames to one Arrow IPC file as record batches; the schema comes from the first chunk."""
+    tmp_path = f"{arrow_path}.{os.getpid()}.tmp"
+    writer = schema = None
+    with pa.OSFile(tmp_path, "wb") as sink:
+        for chunk in chunks:
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if schema is None:
+                # An all-empty column in the first chunk must still accept strings later on
+                schema = pa.schema([field.with_type(pa.string()) if pa.types.is_null(field.type) else field
+                                    for field in table.schema], metadata=table.schema.metadata)
+                writer = pa.ipc.new_file(sink, schema)
+            writer.write_table(table.cast(schema))
+        if writer is not None:
+            writer.close()
+    os.replace(tmp_path, arrow_path)
+
+# === Incremental refresh ===
+def _align_categoricals(base: pd.DataFrame, *others: pd.DataFrame) -> tuple[pd.DataFrame, list[pd.DataFrame]]:
+    """Give others the categorical columns of base over one shared category set, so concat keeps them categorical."""
+    others = list(others)
+    for column in base.columns:
+        if isinstance(base[column].dtype, pd.CategoricalDtype):
+            values = [other[column].astype(object) for other in others if column in other.columns]
+            if not values:
+                continue
+            unseen = pd.Index(pd.concat(values).dropna().unique()).difference(base[column].cat.categories)
+            if len(unseen):
+                base[column] = base[column].cat.add_categories(unseen)
+            for other in others:
+                if column in other.columns:
+                    other[column] = pd.Categorical(other[column].astype(object), categories=base[column].cat.categories)
+    return base, others
+
+class IncrementalLoader:
+    """Keeps the exec frames in sync with an append-only CSV by parsing only the bytes appended since the last load.
+
+    It remembers the byte offset and row count it has ingested, a content key and a hash of the
+    last ANCHOR_BYTES before the offset. The content key starts as the loaded fingerprint's sha256
+    (nothing is hashed again on load) and is chained with each appended block, so render cache keys
+    change with the data. refresh() parses the new tail up to its last newline, derives its date
+    parts, merges its aggregates into the cube and its stats into the schema profile; a line still
+    being written is left for the next refresh. A shrunk file or a changed anchor triggers a full
+    reload instead. The appended chunks are only concatenated onto df when frames is read, so a
+    refresh costs what the new rows cost, and several refreshes share one copy of the frame.
+    The Arrow cache on disk is not rewritten on append; it is rebuilt on the next cold load.
+    """
+
+    ANCHOR_BYTES = 4096
+
+    def __init__(self, csv_path: str, sales_cube: bool=True, ingest_mode: str="frame", chunksize: int | None=None):
+        self.csv_path = csv_path
+        self.sales_cube = sales_cube
+        self.ingest_mode = ingest_mode
+        self.chunksize = chunksize
+        self._frames: dict = {}
+        # Parsed chunks not yet concatenated onto df, and the lazily built schema profile of df
+        self._pending: list[pd.DataFrame] = []
+        self._profile = None
+        self.offset = 0
+        self.rows = 0
+        self._sha256 = None
+        self._anchor = None
+        self._header = b""
+        self._ends_with_newline = True
+        self._mtime_ns = None
+
+    def load(self) -> dict:
+        """Full load through load_exec_frames, then record where ingestion stopped."""
+        frames = load_exec_frames(self.csv_path, self.sales_cube, self.ingest_mode, self.chunksize)
+        # The cache already fingerprinted the source (by size and mtime when it was still valid)
+        fingerprint = frames["df"].attrs["fingerprint"]
+        with open(self.csv_path, "rb") as file:
+            self._header = file.readline()
+
+        self._frames = frames
+        self._pending = []
+        self._profile = None
+        self._sha256 = fingerprint["sha256"]
+        self.offset = fingerprint["size"]
+        self.rows = len(frames["df"]) if self.ingest_mode != "cube" else int(frames["df"]["count"].sum())
+        self._mtime_ns = fingerprint["mtime_ns"]
+        self._ends_with_newline, self._anchor = self._read_anchor()
+        return frames
+
+    @property
+    def frames(self) -> dict:
+        """The exec frames, with any appended chunks concatenated onto df first."""
+        if self._pending:
+            df, chunks = _align_categoricals(self._frames["df"], *self._pending)
+            df = pd.concat([df] + [chunk[df.columns] for chunk in chunks], ignore_index=True)
+            df.attrs["fingerprint"] = self.fingerprint()
+            self._frames["df"] = df
+            self._pending = []
+        return self._frames
+
+    @property
+    def cube(self) -> pd.DataFrame | None:
+        return self._frames.get("cube")
+
+    @property
+    def columns(self) -> pd.Index:
+        return self._frames["df"].columns
+
+    @property
+    def profile(self) -> dict:
+        """profile_frame of df, kept up to date from the appended chunks' own stats."""
+        if self._profile is None:
+            self._profile = profile_frame(self.frames["df"])
+        return self._profile
+
+    def _read_anchor(self) -> tuple[bool, str]:
+        with open(self.csv_path, "rb") as file:
+            file.seek(max(0, self.offset - self.ANCHOR_BYTES))
+            anchor = file.read(self.offset - max(0, self.offset - self.ANCHOR_BYTES))
+        return anchor.endswith(b"\n"), hashlib.sha256(anchor).hexdigest()
+
+    def fingerprint(self) -> dict:
+        return {"size": self.offset, "mtime_ns": self._mtime_ns, "sha256": self._sha256}
+
+    def refresh(self, until: int | None=None) -> dict:
+        """Bring the frames up to date and return {"mode": "unchanged"|"append"|"reload", "new_rows": n}.
+
+        until caps the bytes ingested (a sandbox worker catching up to its parent's offset).
+        """
+        if not self._frames:
+            self.load()
+            return {"mode": "reload", "new_rows": self.rows}
+
+        stat = os.stat(self.csv_path)
+        end = stat.st_size if until is None else min(stat.st_size, until)
+        if stat.st_size < self.offset or self._read_anchor()[1] != self._anchor:
+            previous = self.rows
+            self.load()
+            print(f"{os.path.basename(self.csv_path)} was truncated or rewritten, reloaded {self.rows} rows (had {previous})")
+            return {"mode": "reload", "new_rows": self.rows}
+        if end <= self.offset:
+            return {"mode": "unchanged", "new_rows": 0}
+
+        with open(self.csv_path, "rb") as file:
+            file.seek(self.offset)
+            raw = file.read(end - self.offset)
+        if not self._ends_with_newline and not raw.startswith((b"\n", b"\r\n")):
+            # The last row of the cold load was still being written
+            self.load()
+            return {"mode": "reload", "new_rows": self.rows}
+
+        # Only whole lines are ingested; a row still being written waits for the next refresh
+        raw = raw[:raw.rfind(b"\n") + 1]
+        if not raw:
+            return {"mode": "unchanged", "new_rows": 0}
+        tail = raw if self._ends_with_newline else raw[raw.index(b"\n") + 1:]
+
+        new_rows = self._append(tail)
+        self._sha256 = hashlib.sha256(self._sha256.encode("ascii") + raw).hexdigest()
+        self.offset += len(raw)
+        self._mtime_ns = stat.st_mtime_ns
+        self._ends_with_newline, self._anchor = self._read_anchor()
+        for frame in self._frames.values():
+            frame.attrs["fingerprint"] = self.fingerprint()
+        return {"mode": "append", "new_rows": new_rows}
+
+    def _append(self, tail: bytes) -> int:
+        """Parse appended rows and add them to df and the cube; only the new rows are prepared."""
+        from io import BytesIO
+
+        if not tail.strip():
+            return 0
+        chunk = optimize_dtypes(derive_date_parts(pd.read_csv(BytesIO(self._header + tail))), categoricals=False)
+        if self.ingest_mode == "cube":
+            # The cube is small: profile it again instead of merging
+            cube = self._merge_cube(self._frames["df"], chunk)
+            self._frames = {"df": cube, "cube": cube}
+            self._profile = None
+        else:
+            self._pending.append(chunk)
+            if "cube" in self._frames:
+                self._frames["cube"] = self._merge_cube(self._frames["cube"], chunk)
+            if self._profile is not None:
+                merge_profiles(self._profile, profile_frame(chunk, like=self._profile))
+        self.rows += len(chunk)
+        return len(chunk)
+
+    @staticmethod
+    def _merge_cube(cube: pd.DataFrame, chunk: pd.DataFrame) -> pd.DataFrame:
+        """Fold the chunk's aggregates into the cube: cost follows the cube and the chunk, not the history."""
+        partial = build_sales_cube(chunk)
+        if partial is None:
+            return cube
+        cube, (partial,) = _align_categoricals(cube, partial)
+        return _merge_cubes(cube, partial)
@@ -1,39 +1,130 @@
+from __future__ import annotations
+
 import os
 import re
 import json
 import base64
 import mimetypes
-from typing import Any
+from typing import Any, TYPE_CHECKING
 from pathlib import Path
+from dotenv import load_dotenv
 
 # === Third-Party ===
-import pandas as pd
-from PIL import Image
-from html import escape
-import matplotlib.pyplot as plt
-from IPython.display import HTML, display
-
-
-from dotenv import load_dotenv
+# pandas and IPython are imported where they are used, so CLI and worker imports stay cheap
+if TYPE_CHECKING:
+    import pandas as pd
 
 load_dotenv(override=True)
  
 # === Data Loading ===
-def load_and_prepare_data(csv_path: str) -> pd.DataFrame:
-    """Load CSV and derive date parts commonly used in charts."""
-    df = pd.read_csv(csv_path)
-    # Be tolerant if 'date' exists
-    if "date" in df.columns:
-        df["date"] = pd.to_datetime(df["date"], errors="coerce")
-        df["quarter"] = df["date"].dt.quarter
-        df["month"] = df["date"].dt.month
-        df["year"] = df["date"].dt.year
-    return df
+def load_and_prepare_data(csv_path: str, use_cache: bool=True) -> pd.DataFrame:
+    """Load CSV and derive date parts commonly used in charts (cached as Arrow IPC)."""
+    from utils.dataset_cache import load_prepared_frame
+    return load_prepared_frame(csv_path, use_cache=use_cache)
 
 # === Helpers ===
-def make_schema_text(df: pd.DataFrame) -> str:
-    """Return a human-readable schema from a DataFrame."""
-    return "\n".join(f"- {c}: {dt}" for c, dt in df.dtypes.items())
+# Text columns stop tracking their distinct values past this many; the profile then says "over N"
+PROFILE_MAX_DISTINCT = int(os.getenv("PROFILE_MAX_DISTINCT", "100000"))
+
+def make_schema_text(df: pd.DataFrame, profile: bool=True, max_values: int=8) -> str:
+    """Return a human-readable schema from a DataFrame.
+
+    With profile, each column also gets a short profile: value range and span for numbers and
+    dates, distinct count and the values themselves (or a few examples) for everything else.
+    """
+    if not profile:
+        return "\n".join(f"- {c}: {dt}" for c, dt in df.dtypes.items())
+    return format_profile(profile_frame(df), max_values)
+
+def profile_frame(df: pd.DataFrame, like: dict=None) -> dict:
+    """Per-column stats behind make_schema_text: rows, missing values, min/max or distinct values.
+
+    The stats of two frames merge with merge_profiles, so appended rows only need their own profile.
+    like reuses another profile's dtypes and column kinds, for a chunk that is appended to that frame.
+    """
+    import pandas as pd
+    from pandas.api import types
+
+    columns = {}
+    for column, dtype in df.dtypes.items():
+        base = (like or {}).get("columns", {}).get(column)
+        if base is not None:
+            dtype, kind = base["dtype"], base["kind"]
+        elif types.is_bool_dtype(dtype):
+            kind = "bool"
+        elif types.is_datetime64_any_dtype(dtype):
+            kind = "datetime"
+        elif types.is_numeric_dtype(dtype):
+            kind = "numeric"
+        else:
+            kind = "text"
+
+        non_null = df[column].dropna()
+        stats = {"dtype": dtype, "kind": kind, "non_null": len(non_null), "missing": len(df) - len(non_null)}
+        if kind == "datetime":
+            non_null = pd.to_datetime(non_null, errors="coerce").dropna()
+            stats["date_only"] = bool((non_null.dt.normalize() == non_null).all())
+        elif kind == "numeric":
+            non_null = pd.to_numeric(non_null, errors="coerce").dropna()
+        if kind in ("datetime", "numeric"):
+            stats["min"] = non_null.min() if len(non_null) else None
+            stats["max"] = non_null.max() if len(non_null) else None
+        elif kind == "text":
+            distinct = set(map(str, non_null.unique()))
+            stats["distinct"] = distinct if len(distinct) <= PROFILE_MAX_DISTINCT else None
+        columns[column] = stats
+    return {"rows": len(df), "columns": columns}
+
+def merge_profiles(profile: dict, other: dict) -> dict:
+    """Fold the profile of appended rows into profile, in place, and return it."""
+    profile["rows"] += other["rows"]
+    for column, stats in profile["columns"].items():
+        new = other["columns"].get(column)
+        if new is None:
+            stats["missing"] += other["rows"]
+            continue
+        stats["non_null"] += new["non_null"]
+        stats["missing"] += new["missing"]
+        if "date_only" in stats:
+            stats["date_only"] = stats["date_only"] and new["date_only"]
+        if "min" in stats:
+            stats["min"] = _combine(min, stats["min"], new["min"])
+            stats["max"] = _combine(max, stats["max"], new["max"])
+        if "distinct" in stats:
+            if stats["distinct"] is not None and new["distinct"] is not None:
+                stats["distinct"] |= new["distinct"]
+            if stats["distinct"] is None or new["distinct"] is None or len(stats["distinct"]) > PROFILE_MAX_DISTINCT:
+                stats["distinct"] = None
+    return profile
+
+def _combine(pick, a, b):
+    return b if a is None else a if b is None else pick(a, b)
+
+def format_profile(profile: dict, max_values: int=8) -> str:
+    """Render a profile_frame profile as the schema text used in the prompts."""
+    lines = [f"{profile['rows']} rows"]
+    for column, stats in profile["columns"].items():
+        details = []
+        kind = stats["kind"]
+        if kind == "bool" or not stats["non_null"]:
+            pass
+        elif kind == "datetime":
+            fmt = "%Y-%m-%d" if stats["date_only"] else "%Y-%m-%d %H:%M"
+            details.append(f"{stats['min']:{fmt}} .. {stats['max']:{fmt}}")
+        elif kind == "numeric":
+            details.append(f"{stats['min']:g} .. {stats['max']:g}")
+        elif stats["distinct"] is None:
+            details.append(f"over {PROFILE_MAX_DISTINCT} distinct")
+        else:
+            distinct = sorted(stats["distinct"])
+            if len(distinct) <= max_values:
+                details.append(f"{len(distinct)} distinct: " + ", ".join(repr(value) for value in distinct))
+            else:
+                details.append(f"{len(distinct)} distinct, e.g. " + ", ".join(repr(value) for value in distinct[:3]))
+        if stats["missing"]:
+            details.append(f"{stats['missing']} missing")
+        lines.append(f"- {column}: {stats['dtype']}" + (f", {', '.join(details)}" if details else ""))
+    return "\n".join(lines)
 
 def ensure_execute_python_tags(text: str) -> str:
     """Normalize code to be wrapped in <execute_python>...</execute_python>."""
@@ -44,12 +135,21 @@ def ensure_execute_python_tags(text: str) -> str:
         text = f"<execute_python>\n{text}\n</execute_python>"
     return text
 
+def iter_base64(file, chunk_size: int=3 * 64 * 1024):
+    """Yield the base64 text of a binary file object chunk by chunk.
+
+    chunk_size is a multiple of 3, so the pieces concatenate without inner padding.
+    """
+    chunk_size -= chunk_size % 3
+    while chunk := file.read(chunk_size):
+        yield base64.b64encode(chunk).decode("ascii")
+
 def encode_image_b64(path: str) -> tuple[str, str]:
     """Return (media_type, base64_str) for an image file path."""
     mime, _ = mimetypes.guess_type(path)
     media_type = mime or "image/png"
     with open(path, "rb") as f:
-        b64 = base64.b64encode(f.read()).decode("utf-8")
+        b64 = "".join(iter_base64(f))
     return media_type, b64
 
 
@@ -60,6 +160,9 @@ def print_html(content: Any, title: str | None = None, is_image: bool = False):
     - If content is a pandas DataFrame/Series: render as an HTML table.
     - Otherwise (strings/others): show as code/text in <pre><code>.
     """
+    import pandas as pd
+    from IPython.display import HTML, display
+
     try:
         from html import escape as _escape
     except ImportError: